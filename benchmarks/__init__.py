@@ -0,0 +1 @@
+"""Benchmarks for Sphinx substitution extensions."""
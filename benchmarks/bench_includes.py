@@ -0,0 +1,66 @@
+"""Benchmarks for pages with many ``include`` directives.
+
+Run with ``pytest benchmarks/bench_includes.py``. Use pytest-benchmark's
+options, such as ``--benchmark-save`` and ``--benchmark-compare``, to
+compare runs.
+"""
+
+from collections.abc import Callable  # noqa: TC003
+from pathlib import Path
+
+import pytest
+from pytest_benchmark.fixture import BenchmarkFixture
+from sphinx.testing.util import SphinxTestApp
+
+# The options given to each ``include`` directive, by kind of include.
+_INCLUDE_OPTIONS = {
+    "plain": "",
+    "rst": "   :content-substitutions:\n",
+    "literal": "   :content-substitutions:\n   :literal:\n",
+}
+
+
+def _build(*, source_directory: Path) -> None:
+    """Build a project from scratch."""
+    app = SphinxTestApp(
+        srcdir=source_directory,
+        freshenv=True,
+        exception_on_warning=True,
+        confoverrides={
+            "extensions": ["sphinx_substitution_extensions"],
+            "rst_prolog": ".. |name| replace:: value\n",
+        },
+    )
+    try:
+        app.build()
+    finally:
+        app.cleanup()
+
+
+@pytest.mark.parametrize(
+    argnames="kind", argvalues=["plain", "rst", "literal"]
+)
+@pytest.mark.parametrize(argnames="include_count", argvalues=[100, 500])
+def test_build_page_with_includes(
+    *,
+    benchmark: BenchmarkFixture,
+    tmp_path: Path,
+    include_count: int,
+    kind: str,
+) -> None:
+    """Build a page which includes a file ``include_count`` times."""
+    (tmp_path / "conf.py").touch()
+    (tmp_path / "included.txt").write_text(
+        data="Included |name| content.\n\nMore |name| content.\n",
+    )
+    include = f".. include:: included.txt\n{_INCLUDE_OPTIONS[kind]}\n"
+    (tmp_path / "index.rst").write_text(
+        data="Title\n=====\n\n" + include * include_count,
+    )
+
+    pedantic: Callable[..., object] = benchmark.pedantic  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
+    pedantic(
+        target=_build,
+        kwargs={"source_directory": tmp_path},
+        rounds=5,
+    )
@@ -0,0 +1,328 @@
+"""Microbenchmarks for the substitution primitives.
+
+Run with ``pytest benchmarks/bench_primitives.py``. Use pytest-benchmark's
+options, such as ``--benchmark-save`` and ``--benchmark-compare``, to
+compare runs.
+"""
+
+from collections.abc import Callable
+from pathlib import Path
+
+import pytest
+from docutils.nodes import Node, document, paragraph, target
+from myst_parser.config.main import MdParserConfig
+from pytest_benchmark.fixture import BenchmarkFixture
+from sphinx.application import Sphinx
+from sphinx.testing.util import SphinxTestApp
+
+# pylint: disable-next=import-private-name
+from sphinx_substitution_extensions import (
+    Substitutions,
+    _DocumentStatistics,
+    _flatten_substitutions,
+    _get_substitution_defs,
+    _get_substitutions_digest,
+    _LazySubstitutionMatcher,
+    _process_nodes,
+    _substitute_hyperlink_targets,
+    _SubstitutionMatcher,
+)
+
+# The delimiter pairs for each dialect. MyST documents accept both the reST
+# and the MyST placeholder syntax.
+_DELIMITER_PAIRS = {
+    "rst": {("|", "|")},
+    "myst": {("|", "|"), ("{{", "}}")},
+}
+
+# The placeholder syntax for each dialect.
+_PLACEHOLDER_FORMATS = {
+    "rst": "|{name}|",
+    "myst": "{{{{{name}}}}}",
+}
+
+
+def _make_substitutions(*, key_count: int) -> dict[str, str]:
+    """Make a flat substitution table."""
+    return {f"key{index}": f"value{index}" for index in range(key_count)}
+
+
+def _make_text(
+    *,
+    key_count: int,
+    length: int,
+    density: float,
+    dialect: str,
+) -> str:
+    """Make text of about ``length`` characters in which a ``density``
+    fraction of the words are placeholders.
+    """
+    placeholder_format = _PLACEHOLDER_FORMATS[dialect]
+    words: list[str] = []
+    text_length = 0
+    while text_length < length:
+        index = len(words)
+        if density and index % round(number=1 / density) == 0:
+            word = placeholder_format.format(name=f"key{index % key_count}")
+        else:
+            word = "word"
+        words.append(word)
+        text_length += len(word) + 1
+    return " ".join(words)
+
+
+@pytest.mark.parametrize(argnames="dialect", argvalues=["rst", "myst"])
+@pytest.mark.parametrize(argnames="density", argvalues=[0.0, 0.01, 0.2])
+@pytest.mark.parametrize(argnames="length", argvalues=[80, 80_000])
+@pytest.mark.parametrize(argnames="key_count", argvalues=[10, 1000, 10_000])
+def test_apply(
+    *,
+    benchmark: BenchmarkFixture,
+    key_count: int,
+    length: int,
+    density: float,
+    dialect: str,
+) -> None:
+    """Apply a flat substitution table to text."""
+    matcher = _SubstitutionMatcher(
+        substitution_defs=_make_substitutions(key_count=key_count),
+        delimiter_pairs=_DELIMITER_PAIRS[dialect],
+        statistics=_DocumentStatistics(),
+    )
+    text = _make_text(
+        key_count=key_count,
+        length=length,
+        density=density,
+        dialect=dialect,
+    )
+
+    benchmark(matcher.apply, text=text)
+
+
+@pytest.mark.parametrize(argnames="density", argvalues=[0.0, 0.01, 0.2])
+@pytest.mark.parametrize(argnames="length", argvalues=[80, 80_000])
+@pytest.mark.parametrize(argnames="key_count", argvalues=[10, 1000, 10_000])
+def test_apply_lazy(
+    *,
+    benchmark: BenchmarkFixture,
+    key_count: int,
+    length: int,
+    density: float,
+) -> None:
+    """Apply nested MyST substitutions to text with lazy resolution."""
+    substitutions: Substitutions = {
+        key: {"value": value}
+        for key, value in _make_substitutions(key_count=key_count).items()
+    }
+    matcher = _LazySubstitutionMatcher(
+        substitutions=substitutions,
+        substitutions_digest=_get_substitutions_digest(
+            substitutions=substitutions,
+        ),
+        delimiter_pairs=_DELIMITER_PAIRS["myst"],
+        statistics=_DocumentStatistics(),
+    )
+    text = _make_text(
+        key_count=key_count,
+        length=length,
+        density=density,
+        dialect="myst",
+    ).replace("}}", ".value}}")
+
+    benchmark(matcher.apply, text=text)
+
+
+@pytest.mark.parametrize(argnames="shape", argvalues=["flat", "nested"])
+@pytest.mark.parametrize(argnames="key_count", argvalues=[10, 1000, 10_000])
+def test_flatten_substitutions(
+    *,
+    benchmark: BenchmarkFixture,
+    key_count: int,
+    shape: str,
+) -> None:
+    """Flatten nested MyST substitutions."""
+    substitutions: Substitutions = dict(
+        _make_substitutions(key_count=key_count),
+    )
+    if shape == "nested":
+        substitutions = {
+            key: {"name": value, "items": [value, {"name": value}]}
+            for key, value in _make_substitutions(key_count=key_count).items()
+        }
+
+    benchmark(_flatten_substitutions, substitutions=substitutions)
+
+
+@pytest.mark.parametrize(argnames="dialect", argvalues=["rst", "myst"])
+@pytest.mark.parametrize(argnames="density", argvalues=[0.0, 0.2])
+@pytest.mark.parametrize(argnames="paragraph_count", argvalues=[10, 1000])
+def test_process_nodes(
+    *,
+    benchmark: BenchmarkFixture,
+    paragraph_count: int,
+    density: float,
+    dialect: str,
+) -> None:
+    """Apply substitutions to nodes and their descendants."""
+    key_count = 100
+    matcher = _SubstitutionMatcher(
+        substitution_defs=_make_substitutions(key_count=key_count),
+        delimiter_pairs=_DELIMITER_PAIRS[dialect],
+        statistics=_DocumentStatistics(),
+    )
+    text = _make_text(
+        key_count=key_count,
+        length=200,
+        density=density,
+        dialect=dialect,
+    )
+
+    def setup() -> tuple[tuple[()], dict[str, object]]:
+        """Make new nodes, as substitutions change them."""
+        nodes: list[Node] = [
+            paragraph(rawsource=text, text=text)
+            for _ in range(paragraph_count)
+        ]
+        return (), {
+            "nodes": nodes,
+            "source_path": None,
+            "matcher": matcher,
+            "content_matcher": None,
+        }
+
+    pedantic: Callable[..., object] = benchmark.pedantic  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
+    pedantic(target=_process_nodes, setup=setup, rounds=20)
+
+
+def _benchmark_during_read(
+    *,
+    source_directory: Path,
+    confoverrides: dict[str, object],
+    callback: Callable[[Sphinx, document], None],
+) -> None:
+    """Build a project and call ``callback`` when its document is read.
+
+    Substitution setup uses the state of the document being read, so
+    benchmarks which need it run during ``doctree-read``.
+    """
+    (source_directory / "conf.py").touch()
+    app = SphinxTestApp(
+        srcdir=source_directory,
+        exception_on_warning=True,
+        confoverrides={
+            "extensions": ["myst_parser", "sphinx_substitution_extensions"],
+            **confoverrides,
+        },
+    )
+    try:
+        app.connect(event="doctree-read", callback=callback, priority=400)
+        app.build()
+    finally:
+        app.cleanup()
+
+
+@pytest.mark.parametrize(
+    argnames="source",
+    argvalues=["rst", "myst", "myst_front_matter"],
+)
+@pytest.mark.parametrize(argnames="key_count", argvalues=[10, 1000])
+def test_get_substitution_defs(
+    *,
+    benchmark: BenchmarkFixture,
+    tmp_path: Path,
+    key_count: int,
+    source: str,
+) -> None:
+    """Get the substitution table for a document."""
+    substitutions = _make_substitutions(key_count=key_count)
+    myst_config = None
+    if source == "rst":
+        (tmp_path / "index.rst").write_text(data="Title\n=====\n")
+        confoverrides: dict[str, object] = {
+            "rst_prolog": "".join(
+                f".. |{key}| replace:: {value}\n"
+                for key, value in substitutions.items()
+            ),
+        }
+    else:
+        (tmp_path / "index.md").write_text(data="# Title\n")
+        confoverrides = {
+            "myst_enable_extensions": ["substitution"],
+            "myst_substitutions": substitutions,
+        }
+        if source == "myst_front_matter":
+            # Front matter replaces the global substitutions, so they are
+            # flattened for the document.
+            myst_config = MdParserConfig(
+                enable_extensions={"substitution"},
+                substitutions=dict(substitutions),
+            )
+
+    def callback(app: Sphinx, doctree: document) -> None:
+        """Benchmark getting the table for the document being read."""
+        benchmark(
+            _get_substitution_defs,
+            env=app.env,
+            config=app.config,
+            substitution_defs=doctree.substitution_defs,
+            myst_config=myst_config,
+        )
+
+    _benchmark_during_read(
+        source_directory=tmp_path,
+        confoverrides=confoverrides,
+        callback=callback,
+    )
+
+
+@pytest.mark.parametrize(argnames="template_count", argvalues=[1, 100])
+@pytest.mark.parametrize(argnames="target_count", argvalues=[0, 10, 1000])
+def test_substitute_hyperlink_targets(
+    *,
+    benchmark: BenchmarkFixture,
+    tmp_path: Path,
+    target_count: int,
+    template_count: int,
+) -> None:
+    """Replace placeholders in the hyperlink targets of a document.
+
+    ``template_count`` is the number of distinct URLs among the targets.
+    """
+    targets = "".join(
+        f".. _target{index}: https://example.com/|ver|/"
+        f"{index % template_count}.html\n"
+        for index in range(target_count)
+    )
+    (tmp_path / "index.rst").write_text(
+        data=f"Title\n=====\n\n`Link <https://example.com/>`_\n\n{targets}",
+    )
+
+    def callback(app: Sphinx, doctree: document) -> None:
+        """Benchmark substituting the targets of the document being read."""
+        refuris = [
+            (node, node["refuri"])
+            for node in doctree.findall(condition=target)
+            if "refuri" in node
+        ]
+
+        def setup() -> None:
+            """Restore the targets changed by the previous round."""
+            for node, refuri in refuris:
+                node["refuri"] = refuri
+
+        pedantic: Callable[..., object] = benchmark.pedantic  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
+        pedantic(
+            target=_substitute_hyperlink_targets,
+            args=(app, doctree),
+            setup=setup,
+            rounds=100,
+        )
+
+    _benchmark_during_read(
+        source_directory=tmp_path,
+        confoverrides={
+            "rst_prolog": ".. |ver| replace:: 1.0\n",
+            "substitutions_hyperlink_targets_enabled": True,
+        },
+        callback=callback,
+    )
@@ -0,0 +1,205 @@
+"""Measure how ``sphinx-build`` scales with the size of a project.
+
+For every combination of document, substitution and directive counts, a
+project is generated from the sample project and built:
+
+- serially and with ``-j auto``,
+- from clean, and incrementally after one document changes.
+
+Each build records its wall time, the peak resident set size of the
+largest build process, and the total size of the pickled doctrees and
+environment.
+
+Run with ``python -m benchmarks.build_scaling --help``. This only runs on
+Unix, as the peak resident set size of each build is read with
+``os.wait4``.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from benchmarks.generate_project import generate_project
+
+
+@dataclass(frozen=True)
+class BuildResult:
+    """Measurements of one build."""
+
+    documents: int
+    substitutions: int
+    directives: int
+    parallel: bool
+    incremental: bool
+    wall_time_seconds: float
+    peak_rss_kib: int
+    pickle_bytes: int
+
+
+def _pickle_bytes(*, doctree_directory: Path) -> int:
+    """Get the total size of the pickled doctrees and environment."""
+    return sum(
+        path.stat().st_size
+        for path in doctree_directory.rglob(pattern="*")
+        if path.suffix in {".doctree", ".pickle"}
+    )
+
+
+def _run_build(
+    *,
+    source_directory: Path,
+    output_directory: Path,
+    parallel: bool,
+) -> tuple[float, int]:
+    """Run ``sphinx-build`` and get its wall time and peak RSS in KiB."""
+    args = [
+        sys.executable,
+        "-m",
+        "sphinx",
+        "--quiet",
+        "--builder=html",
+        str(object=source_directory),
+        str(object=output_directory),
+    ]
+    if parallel:
+        args.append("--jobs=auto")
+
+    start = time.perf_counter()
+    with subprocess.Popen(args=args) as process:  # noqa: S603
+        # The resource usage of all children would include earlier builds,
+        # so this build's usage is read as the process is reaped.  Setting
+        # the return code stops ``Popen`` from waiting for it again.
+        _, wait_status, resource_usage = os.wait4(process.pid, 0)
+        wall_time_seconds = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(wait_status)
+    if process.returncode:
+        raise subprocess.CalledProcessError(
+            returncode=process.returncode,
+            cmd=args,
+        )
+
+    peak_rss = resource_usage.ru_maxrss
+    if sys.platform == "darwin":
+        # macOS reports bytes rather than KiB.
+        peak_rss //= 1024
+    return wall_time_seconds, peak_rss
+
+
+def measure(
+    *,
+    documents: int,
+    substitutions: int,
+    directives: int,
+) -> list[BuildResult]:
+    """Build a generated project in every mode."""
+    results: list[BuildResult] = []
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        source_directory = Path(temporary_directory) / "source"
+        generated_documents = generate_project(
+            destination=source_directory,
+            document_count=documents,
+            substitution_count=substitutions,
+            directive_count=directives,
+        )
+        for parallel in (False, True):
+            output_directory = (
+                Path(temporary_directory) / f"build-parallel-{parallel}"
+            )
+            for incremental in (False, True):
+                if incremental:
+                    with generated_documents[0].open(mode="a") as file:
+                        file.write("\nChanged.\n")
+                wall_time_seconds, peak_rss_kib = _run_build(
+                    source_directory=source_directory,
+                    output_directory=output_directory,
+                    parallel=parallel,
+                )
+                results.append(
+                    BuildResult(
+                        documents=documents,
+                        substitutions=substitutions,
+                        directives=directives,
+                        parallel=parallel,
+                        incremental=incremental,
+                        wall_time_seconds=wall_time_seconds,
+                        peak_rss_kib=peak_rss_kib,
+                        pickle_bytes=_pickle_bytes(
+                            doctree_directory=output_directory / ".doctrees",
+                        ),
+                    ),
+                )
+    return results
+
+
+def main() -> None:
+    """Measure builds for the sizes given on the command line."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--documents",
+        type=int,
+        nargs="+",
+        default=[10, 100, 1000],
+    )
+    parser.add_argument(
+        "--substitutions",
+        type=int,
+        nargs="+",
+        default=[100],
+    )
+    parser.add_argument("--directives", type=int, nargs="+", default=[10])
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="Write the results to this JSON file.",
+    )
+    arguments = parser.parse_args()
+
+    results: list[BuildResult] = []
+    header = (
+        f"{'docs':>6}{'subs':>7}{'uses':>6}{'mode':>10}{'build':>13}"
+        f"{'seconds':>10}{'ms/doc':>9}{'RSS MiB':>9}{'pickle MiB':>12}\n"
+    )
+    sys.stdout.write(header)
+    for documents, substitutions, directives in itertools.product(
+        arguments.documents,
+        arguments.substitutions,
+        arguments.directives,
+    ):
+        for result in measure(
+            documents=documents,
+            substitutions=substitutions,
+            directives=directives,
+        ):
+            results.append(result)
+            mode = "parallel" if result.parallel else "serial"
+            build = "incremental" if result.incremental else "clean"
+            milliseconds_per_document = (
+                1000 * result.wall_time_seconds / result.documents
+            )
+            sys.stdout.write(
+                f"{result.documents:>6}{result.substitutions:>7}"
+                f"{result.directives:>6}{mode:>10}{build:>13}"
+                f"{result.wall_time_seconds:>10.2f}"
+                f"{milliseconds_per_document:>9.1f}"
+                f"{result.peak_rss_kib / 1024:>9.1f}"
+                f"{result.pickle_bytes / 1024 / 1024:>12.2f}\n",
+            )
+
+    if arguments.output is not None:
+        arguments.output.write_text(
+            data=json.dumps(
+                obj=[asdict(obj=result) for result in results],
+                indent=2,
+            ),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Generate synthetic Sphinx projects from the sample project.
+
+Each project has ``document_count`` documents, alternating between reST and
+MyST Markdown, ``substitution_count`` substitutions, and
+``directive_count`` uses of the extension's directives and roles in each
+document.
+
+Run with ``python -m benchmarks.generate_project --help``.
+"""
+
+import argparse
+import shutil
+from pathlib import Path
+
+# The sample project, which provides the files that directives include.
+SAMPLE_SOURCE_DIRECTORY = Path(__file__).parent.parent / "sample" / "source"
+
+# Files copied from the sample project. ``|author|`` is ``Eleanor`` in reST
+# documents and ``Talya`` in MyST documents.
+_SAMPLE_FILES = (
+    "Eleanor.txt",
+    "Eleanor_diagram.png",
+    "Talya.txt",
+    "Talya_diagram.png",
+    "sample_content_include.txt",
+    "sample_include.txt",
+)
+
+# Uses of the extension's directives and roles in reST documents. ``{name}``
+# is replaced with the name of a substitution.
+_RST_DIRECTIVE_TEMPLATES = (
+    """\
+.. code-block:: shell
+   :substitutions:
+
+   echo "|{name}| by |author|"
+""",
+    """\
+Run :substitution-code:`echo |{name}|`.
+""",
+    """\
+.. literalinclude:: sample_include.txt
+   :content-substitutions:
+""",
+    """\
+.. include:: sample_content_include.txt
+   :content-substitutions:
+""",
+    """\
+.. image:: |author|_diagram.png
+   :path-substitutions:
+   :alt: Diagram for |{name}|
+""",
+    """\
+Download :substitution-download:`the script for |{name}| <|author|.txt>`.
+""",
+)
+
+# Uses of the extension's directives and roles in MyST documents.
+_MARKDOWN_DIRECTIVE_TEMPLATES = (
+    """\
+```{{code-block}} shell
+:substitutions:
+
+echo "{{{{{name}}}}} by |author|"
+```
+""",
+    """\
+Run {{substitution-code}}`echo |{name}|`.
+""",
+    """\
+```{{literalinclude}} sample_include.txt
+:content-substitutions:
+```
+""",
+    """\
+```{{literalinclude}} {{{{author}}}}.txt
+:path-substitutions:
+```
+""",
+    """\
+```{{image}} {{{{author}}}}_diagram.png
+:path-substitutions:
+:alt: Diagram
+```
+""",
+    """\
+Download {{substitution-download}}`the script for |{name}| <|author|.txt>`.
+""",
+)
+
+
+def _document_body(
+    *,
+    templates: tuple[str, ...],
+    document_index: int,
+    substitution_count: int,
+    directive_count: int,
+) -> str:
+    """Get ``directive_count`` directive uses for a document."""
+    uses: list[str] = []
+    for use_index in range(directive_count):
+        overall_index = document_index * directive_count + use_index
+        template = templates[overall_index % len(templates)]
+        name = f"sub{overall_index % substitution_count}"
+        uses.append(template.format(name=name))
+    return "\n".join(uses)
+
+
+def generate_project(
+    *,
+    destination: Path,
+    document_count: int,
+    substitution_count: int,
+    directive_count: int,
+) -> list[Path]:
+    """Write a synthetic project to ``destination``.
+
+    The generated documents are returned.
+    """
+    destination.mkdir(parents=True, exist_ok=True)
+    for filename in _SAMPLE_FILES:
+        shutil.copy2(
+            src=SAMPLE_SOURCE_DIRECTORY / filename,
+            dst=destination / filename,
+        )
+
+    substitutions = {
+        f"sub{index}": f"value{index}" for index in range(substitution_count)
+    }
+    rst_prolog = "".join(
+        f".. |{name}| replace:: {value}\n"
+        for name, value in substitutions.items()
+    )
+    myst_substitutions = {"author": "Talya", **substitutions}
+    (destination / "conf.py").write_text(
+        data=(
+            '"""Generated ``conf.py``."""\n\n'
+            "extensions = [\n"
+            '    "myst_parser",\n'
+            '    "sphinx_substitution_extensions",\n'
+            "]\n\n"
+            f'rst_prolog = """\n'
+            ".. |author| replace:: Eleanor\n"
+            f'{rst_prolog}"""\n\n'
+            'myst_enable_extensions = ["substitution"]\n'
+            f"myst_substitutions = {myst_substitutions!r}\n"
+        ),
+    )
+
+    documents: list[Path] = []
+    for document_index in range(document_count):
+        title = f"Document {document_index}"
+        if document_index % 2:
+            document = destination / f"document_{document_index}.md"
+            body = _document_body(
+                templates=_MARKDOWN_DIRECTIVE_TEMPLATES,
+                document_index=document_index,
+                substitution_count=substitution_count,
+                directive_count=directive_count,
+            )
+            document.write_text(data=f"# {title}\n\n{body}")
+        else:
+            document = destination / f"document_{document_index}.rst"
+            body = _document_body(
+                templates=_RST_DIRECTIVE_TEMPLATES,
+                document_index=document_index,
+                substitution_count=substitution_count,
+                directive_count=directive_count,
+            )
+            underline = "=" * len(title)
+            document.write_text(data=f"{title}\n{underline}\n\n{body}")
+        documents.append(document)
+
+    toctree_entries = "".join(
+        f"   {document.stem}\n" for document in documents
+    )
+    (destination / "index.rst").write_text(
+        data=f"Index\n=====\n\n.. toctree::\n\n{toctree_entries}",
+    )
+    return documents
+
+
+def main() -> None:
+    """Generate a synthetic project from command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("destination", type=Path)
+    parser.add_argument("--documents", type=int, default=100)
+    parser.add_argument("--substitutions", type=int, default=100)
+    parser.add_argument("--directives", type=int, default=10)
+    arguments = parser.parse_args()
+    generate_project(
+        destination=arguments.destination,
+        document_count=arguments.documents,
+        substitution_count=arguments.substitutions,
+        directive_count=arguments.directives,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Measure how long it takes to import the extension.
+
+Each measurement runs ``python -X importtime`` in a new Python process.
+Sphinx and docutils are imported first, as they are when ``sphinx-build``
+loads the extension, so that only the time added by the extension is
+reported.
+
+Run with ``python benchmarks/import_time.py``.
+"""
+
+import argparse
+import subprocess
+import sys
+
+# Modules which ``sphinx-build`` imports before it loads extensions.
+_PRELOADED_MODULES = (
+    "docutils.parsers.rst",
+    "sphinx.application",
+    "sphinx.builders.html",
+    "sphinx.cmd.build",
+    "sphinx.directives.code",
+)
+
+_EXTENSION_MODULE = "sphinx_substitution_extensions"
+
+
+def _import_times() -> dict[str, tuple[int, int]]:
+    """Get the self and cumulative import times, in microseconds, of the
+    extension and of each module which it imports directly.
+    """
+    preload = "; ".join(f"import {module}" for module in _PRELOADED_MODULES)
+    result = subprocess.run(  # noqa: S603
+        args=[
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            f"{preload}; import {_EXTENSION_MODULE}",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # Each module's line follows the more indented lines of the modules
+    # which it imports.
+    lines = result.stderr.splitlines()
+    extension_index = next(
+        index
+        for index, line in enumerate(iterable=lines)
+        if line.endswith(f"| {_EXTENSION_MODULE}")
+    )
+    first_index = extension_index
+    while lines[first_index - 1].split(sep="|")[2].startswith("  "):
+        first_index -= 1
+    extension_lines = lines[first_index : extension_index + 1]
+
+    times: dict[str, tuple[int, int]] = {}
+    for line in extension_lines:
+        self_time, cumulative_time, module = line.removeprefix(
+            "import time:",
+        ).split(sep="|")
+        # Only the extension and the modules which it imports directly are
+        # reported.
+        if not module.startswith("    "):
+            times[module.strip()] = (int(self_time), int(cumulative_time))
+    return times
+
+
+def main() -> None:
+    """Print the fastest import time of the extension and the modules which
+    take the longest to import.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    arguments = parser.parse_args()
+
+    runs = [_import_times() for _ in range(arguments.repeat)]
+    fastest = min(runs, key=lambda times: times[_EXTENSION_MODULE][1])
+    sys.stdout.write(
+        f"{_EXTENSION_MODULE}: {fastest[_EXTENSION_MODULE][1] / 1000:.1f}ms\n",
+    )
+    slowest_modules = sorted(
+        fastest.items(),
+        key=lambda item: item[1][1],
+        reverse=True,
+    )[1 : arguments.top + 1]
+    for module, (self_time, cumulative_time) in slowest_modules:
+        sys.stdout.write(
+            f"{module:<60}"
+            f"{self_time / 1000:>8.1f}ms"
+            f"{cumulative_time / 1000:>8.1f}ms\n",
+        )
+
+
+if __name__ == "__main__":
+    main()
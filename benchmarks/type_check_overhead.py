@@ -0,0 +1,126 @@
+"""Measure the per-call overhead of runtime type checks.
+
+Each measurement runs in a new Python process, because runtime type checks
+are added or skipped when the extension is imported.
+
+Run with ``python benchmarks/type_check_overhead.py``.
+"""
+
+import os
+import subprocess
+import sys
+import timeit
+
+from docutils.nodes import Node, Text, paragraph
+
+from sphinx_substitution_extensions.shared import (
+    SKIP_TYPE_CHECKS_ENVIRONMENT_VARIABLE,
+)
+
+# The number of calls timed for each function in each repeat.
+_NUMBER = 20_000
+# The number of repeats. The fastest repeat is reported.
+_REPEAT = 5
+
+
+def _measure() -> dict[str, float]:
+    """Get the time per call, in nanoseconds, of hot path functions."""
+    # pylint: disable-next=import-private-name
+    from sphinx_substitution_extensions import (  # noqa: PLC0415
+        _DocumentStatistics,
+        _get_myst_config,
+        _process_nodes,
+        _SubstitutionMatcher,
+    )
+
+    matcher = _SubstitutionMatcher(
+        substitution_defs={f"key{index}": "value" for index in range(100)},
+        delimiter_pairs={("|", "|")},
+        statistics=_DocumentStatistics(),
+    )
+    nodes: list[Node] = [
+        paragraph("", "", Text(data="Text with |key1| and |key2|."))
+        for _ in range(10)
+    ]
+
+    def apply_with_placeholder() -> None:
+        """Apply substitutions to text with placeholders."""
+        matcher.apply(text="Install version |key1| of |key99|.")
+
+    def apply_without_placeholder() -> None:
+        """Apply substitutions to text without placeholders."""
+        matcher.apply(text="Install the latest version.")
+
+    def process_nodes() -> None:
+        """Apply substitutions to a list of nodes."""
+        _process_nodes(
+            nodes=nodes,
+            source_path=None,
+            matcher=matcher,
+            content_matcher=None,
+        )
+
+    def get_myst_config() -> None:
+        """Get the MyST configuration for a reST parsing context."""
+        _get_myst_config(context=None)
+
+    functions = {
+        "matcher.apply (placeholders)": apply_with_placeholder,
+        "matcher.apply (no placeholders)": apply_without_placeholder,
+        "_process_nodes (10 paragraphs)": process_nodes,
+        "_get_myst_config": get_myst_config,
+    }
+    return {
+        name: min(timeit.repeat(stmt=function, number=_NUMBER, repeat=_REPEAT))
+        / _NUMBER
+        * 1e9
+        for name, function in functions.items()
+    }
+
+
+def _run_child(*, skip_type_checks: bool) -> dict[str, float]:
+    """Measure in a new process with or without runtime type checks."""
+    result = subprocess.run(  # noqa: S603
+        args=[sys.executable, __file__, "--child"],
+        env={
+            **os.environ,
+            SKIP_TYPE_CHECKS_ENVIRONMENT_VARIABLE: (
+                "1" if skip_type_checks else ""
+            ),
+        },
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    results: dict[str, float] = {}
+    for line in result.stdout.splitlines():
+        name, _, nanoseconds = line.rpartition("\t")
+        results[name] = float(nanoseconds)
+    return results
+
+
+def main() -> None:
+    """Print the time per call with and without runtime type checks."""
+    if sys.argv[1:] == ["--child"]:
+        for name, nanoseconds in _measure().items():
+            sys.stdout.write(f"{name}\t{nanoseconds}\n")
+        return
+
+    checked = _run_child(skip_type_checks=False)
+    unchecked = _run_child(skip_type_checks=True)
+    sys.stdout.write(
+        f"{'function':<34}{'checked':>12}{'unchecked':>12}{'overhead':>12}\n",
+    )
+    for name, checked_nanoseconds in checked.items():
+        unchecked_nanoseconds = unchecked[name]
+        overhead = checked_nanoseconds - unchecked_nanoseconds
+        sys.stdout.write(
+            f"{name:<34}"
+            f"{checked_nanoseconds:>10.0f}ns"
+            f"{unchecked_nanoseconds:>10.0f}ns"
+            f"{overhead:>10.0f}ns\n",
+        )
+
+
+if __name__ == "__main__":
+    main()
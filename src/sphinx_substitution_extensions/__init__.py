@@ -1,16 +1,36 @@
 """Custom Sphinx extensions."""
 
+import codecs
+import copy
+import hashlib
+import io
+import json
+import mmap
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Generator, Iterable
+from collections.abc import Set as AbstractSet
+from contextlib import contextmanager
+from functools import cached_property, lru_cache
 from importlib.metadata import version
 from pathlib import Path
 from typing import Any, ClassVar, TypeAlias
-from unittest.mock import patch
+from weakref import WeakKeyDictionary
 
-from beartype import beartype
+from beartype import BeartypeConf, BeartypeStrategy, beartype
+from beartype.typing import Protocol, runtime_checkable
 from docutils.nodes import (
     Element,
     Node,
     Text,
+    caption,
     document,
+    literal_block,
     reference,
     substitution_definition,
     system_message,
@@ -23,16 +43,24 @@ from docutils.parsers.rst.roles import code_role
 from docutils.parsers.rst.states import Inliner
 from docutils.statemachine import StringList
 from myst_parser.config.main import MdParserConfig
-from myst_parser.mdit_to_docutils.base import DocutilsRenderer
-from myst_parser.mocking import MockInliner, MockState
 from sphinx import addnodes
+from sphinx import util as sphinx_util
 from sphinx.application import Sphinx
 from sphinx.config import Config
-from sphinx.directives.code import CodeBlock, LiteralInclude
+from sphinx.directives.code import (
+    CodeBlock,
+    LiteralInclude,
+    LiteralIncludeReader,
+    container_wrapper,
+)
 from sphinx.directives.other import Include
 from sphinx.environment import BuildEnvironment
 from sphinx.errors import SphinxError
+from sphinx.events import EventManager
+from sphinx.locale import get_translation
+from sphinx.parsers import RSTParser
 from sphinx.roles import XRefRole
+from sphinx.util import logging
 from sphinx.util.typing import ExtensionMetadata, OptionSpec
 
 from sphinx_substitution_extensions.shared import (
@@ -41,7 +69,9 @@ from sphinx_substitution_extensions.shared import (
     NO_PATH_SUBSTITUTION_OPTION_NAME,
     NO_SUBSTITUTION_OPTION_NAME,
     PATH_SUBSTITUTION_OPTION_NAME,
+    SKIP_TYPE_CHECKS_ENVIRONMENT_VARIABLE,
     SUBSTITUTION_OPTION_NAME,
+    SUBSTITUTIONS_BEFORE_FILTERS_OPTION_NAME,
 )
 
 SubstitutionValue: TypeAlias = (
@@ -53,10 +83,40 @@ SubstitutionValue: TypeAlias = (
 )
 Substitutions: TypeAlias = dict[str, SubstitutionValue]
 
+_LOGGER = logging.getLogger(name=__name__)
+
+# Sphinx's own translations of the messages which it logs to the console,
+# for messages which match Sphinx's.
+__ = get_translation(catalog="sphinx", namespace="console")
+
+# Runtime type checks are added when functions and classes are defined, so
+# this is read when the extension is imported.
+_BEARTYPE_CONF = BeartypeConf(
+    strategy=(
+        BeartypeStrategy.O0
+        if os.environ.get(key=SKIP_TYPE_CHECKS_ENVIRONMENT_VARIABLE) == "1"
+        else BeartypeStrategy.O1
+    ),
+)
+
 
-@beartype
+@beartype(conf=_BEARTYPE_CONF)
 def _get_myst_config(*, context: object) -> MdParserConfig | None:
     """Get the effective MyST configuration from a parsing context."""
+    # MyST's parser is slow to import, so it is imported only once MyST has
+    # created a parsing context. Projects which only use reST never import
+    # it.
+    if "myst_parser.mocking" not in sys.modules:
+        return None
+
+    # pylint: disable-next=import-outside-toplevel
+    from myst_parser.mdit_to_docutils.base import (  # noqa: PLC0415
+        DocutilsRenderer,
+    )
+
+    # pylint: disable-next=import-outside-toplevel
+    from myst_parser.mocking import MockInliner, MockState  # noqa: PLC0415
+
     if isinstance(context, (MockInliner, MockState)):
         # MyST merges front matter into a document-local configuration before
         # it creates these parsing contexts. The Sphinx configuration only
@@ -72,7 +132,7 @@ def _get_myst_config(*, context: object) -> MdParserConfig | None:
     return None
 
 
-@beartype
+@beartype(conf=_BEARTYPE_CONF)
 def _validate_substitution_key(*, key: str) -> None:
     """Validate that a substitution key does not contain dots.
 
@@ -137,7 +197,111 @@ def _flatten_substitutions(
     return result
 
 
-@beartype
+# Flattened global ``myst_substitutions``, computed once at
+# ``config-inited``. This is kept out of the configuration and the
+# environment so that it is not pickled, and parallel read workers inherit
+# it when they are forked.
+_FLATTENED_MYST_SUBSTITUTIONS: WeakKeyDictionary[Config, dict[str, str]] = (
+    WeakKeyDictionary()
+)
+
+
+# Digests of the global ``myst_substitutions`` for lazy resolution, computed
+# once at ``config-inited`` like the flattened substitutions.
+_MYST_SUBSTITUTIONS_DIGESTS: WeakKeyDictionary[Config, str] = (
+    WeakKeyDictionary()
+)
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _get_digest(*, text: str) -> str:
+    """Get the SHA-256 digest of text as hexadecimal."""
+    # ``hashlib.sha256`` names its argument differently in different Python
+    # versions, but ``update`` takes it positionally.
+    hash_object = hashlib.sha256()
+    hash_object.update(text.encode())
+    return hash_object.hexdigest()
+
+
+# NOTE: beartype is not used here
+# because it throws `beartype.roar.BeartypeCallHintForwardRefException`
+# for recursive type `Substitutions`
+def _get_substitutions_digest(*, substitutions: Substitutions) -> str:
+    """Get a digest which is equal for equal nested substitutions.
+
+    Values which JSON cannot represent, such as dates parsed from MyST
+    front matter, are included as the strings which replace placeholders.
+    """
+    serialized = json.dumps(obj=substitutions, sort_keys=True, default=str)
+    return _get_digest(text=serialized)
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _flatten_myst_substitutions(_app: Sphinx, config: Config) -> None:
+    """Flatten and validate the global MyST substitutions.
+
+    A :class:`~sphinx.errors.SphinxError` is raised if any key contains a
+    dot. With lazy resolution, only the top-level keys are validated.
+    """
+    if "myst_substitutions" not in config:
+        return
+
+    if "substitution" not in config.myst_enable_extensions:
+        return
+
+    if config.substitutions_lazy_resolution_enabled:
+        # Nested keys are only read when a placeholder refers to them.
+        for key in config.myst_substitutions:
+            _validate_substitution_key(key=key)
+        _MYST_SUBSTITUTIONS_DIGESTS[config] = _get_substitutions_digest(
+            substitutions=dict(config.myst_substitutions),
+        )
+        return
+
+    _FLATTENED_MYST_SUBSTITUTIONS[config] = _flatten_substitutions(
+        substitutions=dict(config.myst_substitutions),
+    )
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _is_markdown_parser(*, env: BuildEnvironment, config: Config) -> bool:
+    """Whether the document being read is parsed as Markdown."""
+    markdown_suffixes = {
+        key.lstrip(".")
+        for key, value in config.source_suffix.items()
+        if value == "markdown"
+    }
+    parser_supported_formats = set(env.parser.supported)
+    return bool(parser_supported_formats.intersection(markdown_suffixes))
+
+
+# NOTE: beartype is not used here
+# because it throws `beartype.roar.BeartypeCallHintForwardRefException`
+# for recursive type `Substitutions`
+def _get_myst_substitutions(
+    *,
+    config: Config,
+    myst_config: MdParserConfig | None,
+) -> Substitutions | None:
+    """Get the MyST substitutions for a Markdown document.
+
+    ``None`` is returned if the MyST ``substitution`` extension is not
+    enabled.
+    """
+    substitutions: Substitutions
+    if myst_config is None:
+        enable_extensions = config.myst_enable_extensions
+        substitutions = config.myst_substitutions
+    else:
+        enable_extensions = myst_config.enable_extensions
+        substitutions = myst_config.substitutions
+
+    if "substitution" not in enable_extensions:
+        return None
+    return substitutions
+
+
+@beartype(conf=_BEARTYPE_CONF)
 def _get_delimiter_pairs(
     *,
     env: BuildEnvironment,
@@ -145,18 +309,11 @@ def _get_delimiter_pairs(
     myst_config: MdParserConfig | None,
 ) -> set[tuple[str, str]]:
     """Get the delimiter pairs for substitution."""
-    markdown_suffixes = {
-        key.lstrip(".")
-        for key, value in config.source_suffix.items()
-        if value == "markdown"
-    }
-
     # Use `| |` on reST as it is the default substitution syntax.
     # Use `| |` on MyST for backwards compatibility as this is what we
     # originally shipped with.
     delimiter_pairs = {("|", "|")}
-    parser_supported_formats = set(env.parser.supported)
-    if parser_supported_formats.intersection(markdown_suffixes):
+    if _is_markdown_parser(env=env, config=config):
         if myst_config is None:
             opening_delimiter, closing_delimiter = config.myst_sub_delimiters
         else:
@@ -170,7 +327,7 @@ def _get_delimiter_pairs(
     return delimiter_pairs
 
 
-@beartype
+@beartype(conf=_BEARTYPE_CONF)
 def _get_substitution_defs(
     *,
     env: BuildEnvironment,
@@ -179,24 +336,25 @@ def _get_substitution_defs(
     myst_config: MdParserConfig | None,
 ) -> dict[str, str]:
     """Get the substitution definitions from the environment."""
-    markdown_suffixes = {
-        key.lstrip(".")
-        for key, value in config.source_suffix.items()
-        if value == "markdown"
-    }
-
-    parser_supported_formats = set(env.parser.supported)
-    if parser_supported_formats.intersection(markdown_suffixes):
-        if myst_config is None:
-            enable_extensions = config.myst_enable_extensions
-            substitutions = dict(config.myst_substitutions)
-        else:
-            enable_extensions = myst_config.enable_extensions
-            substitutions = dict(myst_config.substitutions)
-
-        if "substitution" in enable_extensions:
+    if _is_markdown_parser(env=env, config=config):
+        substitutions = _get_myst_substitutions(
+            config=config,
+            myst_config=myst_config,
+        )
+        if substitutions is not None:
+            flattened_substitutions = _FLATTENED_MYST_SUBSTITUTIONS.get(
+                key=config,
+            )
+            if (
+                flattened_substitutions is not None
+                and substitutions is config.myst_substitutions
+            ):
+                return flattened_substitutions
+
+            # MyST front matter has replaced the global substitutions, or
+            # enabled substitutions for this document only.
             return _flatten_substitutions(
-                substitutions=substitutions,
+                substitutions=dict(substitutions),
             )
     else:
         return {
@@ -206,395 +364,1904 @@ def _get_substitution_defs(
     return {}
 
 
-@beartype
-def _apply_substitutions(
-    *,
-    text: str,
-    substitution_defs: dict[str, str],
-    delimiter_pairs: set[tuple[str, str]],
-) -> str:
-    """Apply substitutions to text using the given delimiter pairs."""
-    new_text = text
-    for name, replacement in substitution_defs.items():
-        for delimiter_pair in delimiter_pairs:
-            opening_delimiter, closing_delimiter = delimiter_pair
-            new_text = new_text.replace(
-                f"{opening_delimiter}{name}{closing_delimiter}",
-                replacement,
-            )
-    return new_text
-
-
-@beartype
-def _should_apply_substitutions(
-    *,
-    options: dict[str, Any],
-    config: Config,
-    yes_flag: str,
-    no_flag: str,
-) -> bool:
-    """
-    Whether substitutions should be applied based on flags and
-    configuration.
-    """
-    if no_flag in options:
-        return False
-    if yes_flag in options:
-        return True
-    return bool(config.substitutions_default_enabled)
-
+@beartype(conf=_BEARTYPE_CONF)
+class _ComponentStatistics:
+    """Timings and counts for one directive, role or pass in a document."""
 
-@beartype
-def _process_node(
-    *,
-    node: Element,
-    source_path: Path | None,
-    substitution_defs: dict[str, str],
-    delimiter_pairs: set[tuple[str, str]],
-) -> None:
-    """Recursively process nodes to apply substitutions."""
-    if (
-        source_path is not None
-        and node.source is not None
-        and Path(node.source).resolve() != source_path
-    ):
-        return
+    def __init__(self) -> None:
+        """Start with no calls recorded."""
+        self.calls = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.placeholders = 0
+        self.rewritten_characters = 0
 
-    node.rawsource = _apply_substitutions(
-        text=node.rawsource,
-        substitution_defs=substitution_defs,
-        delimiter_pairs=delimiter_pairs,
-    )
-
-    for child in list(node.children):
-        if isinstance(child, Text):
-            node.replace(
-                old=child,
-                new=Text(
-                    data=_apply_substitutions(
-                        text=child.astext(),
-                        substitution_defs=substitution_defs,
-                        delimiter_pairs=delimiter_pairs,
-                    ),
-                ),
-            )
-        else:
-            assert isinstance(child, Element)
-            _process_node(
-                node=child,
-                source_path=source_path,
-                substitution_defs=substitution_defs,
-                delimiter_pairs=delimiter_pairs,
+    def record(
+        self,
+        *,
+        seconds: float,
+        placeholders: int,
+        rewritten_characters: int,
+    ) -> None:
+        """Record one call."""
+        self.calls += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.placeholders += placeholders
+        self.rewritten_characters += rewritten_characters
+
+    def add(self, *, other: "_ComponentStatistics") -> None:
+        """Add the calls recorded in other statistics."""
+        self.calls += other.calls
+        self.total_seconds += other.total_seconds
+        self.max_seconds = max(self.max_seconds, other.max_seconds)
+        self.placeholders += other.placeholders
+        self.rewritten_characters += other.rewritten_characters
+
+
+@beartype(conf=_BEARTYPE_CONF)
+class _DocumentStatistics:
+    """Counts of the texts given to matchers for one document."""
+
+    def __init__(self) -> None:
+        """Start with no texts counted."""
+        #: Texts given to a matcher.
+        self.texts = 0
+        #: Texts returned unchanged because they contain no opening
+        #: delimiter.
+        self.skipped = 0
+        #: Placeholders replaced.
+        self.placeholders = 0
+        #: The length of texts changed by substitutions.
+        self.rewritten_characters = 0
+        #: Included file contents served from the substituted content
+        #: cache, and those which were substituted and added to it.
+        self.content_cache_hits = 0
+        self.content_cache_misses = 0
+        #: Included file contents served from the on-disk cache, and those
+        #: which were substituted and written to it.
+        self.disk_cache_hits = 0
+        self.disk_cache_misses = 0
+        #: Statistics by directive, role or pass, recorded only when
+        #: instrumentation is enabled.
+        self.components: dict[str, _ComponentStatistics] = {}
+
+    def add(self, *, other: "_DocumentStatistics") -> None:
+        """Add the counts from other statistics."""
+        self.texts += other.texts
+        self.skipped += other.skipped
+        self.placeholders += other.placeholders
+        self.rewritten_characters += other.rewritten_characters
+        self.content_cache_hits += other.content_cache_hits
+        self.content_cache_misses += other.content_cache_misses
+        self.disk_cache_hits += other.disk_cache_hits
+        self.disk_cache_misses += other.disk_cache_misses
+        for name, component_statistics in other.components.items():
+            self.components.setdefault(name, _ComponentStatistics()).add(
+                other=component_statistics,
             )
 
+    def to_json(self) -> dict[str, Any]:
+        """Get the statistics as JSON-compatible data."""
+        return {
+            "texts": self.texts,
+            "skipped": self.skipped,
+            "placeholders": self.placeholders,
+            "rewritten_characters": self.rewritten_characters,
+            "content_cache_hits": self.content_cache_hits,
+            "content_cache_misses": self.content_cache_misses,
+            "disk_cache_hits": self.disk_cache_hits,
+            "disk_cache_misses": self.disk_cache_misses,
+            "components": {
+                name: dict(vars(component_statistics))
+                for name, component_statistics in sorted(
+                    self.components.items(),
+                )
+            },
+        }
 
-@beartype
-def _substitute_hyperlink_targets(
-    app: Sphinx,
-    doctree: document,
-) -> None:
-    """Replace placeholders in hyperlink targets."""
-    if not app.config.substitutions_hyperlink_targets_enabled:
-        return
 
-    substitution_defs = _get_substitution_defs(
-        env=app.env,
-        config=app.config,
-        substitution_defs=doctree.substitution_defs,
-        myst_config=None,
-    )
-    delimiter_pairs = _get_delimiter_pairs(
-        env=app.env,
-        config=app.config,
-        myst_config=None,
-    )
+@beartype(conf=_BEARTYPE_CONF)
+class _SubstitutionMatcher:
+    """Apply a substitution table to text in a single pass.
 
-    for node in doctree.findall():
-        if not isinstance(node, (reference, target_node)):
-            continue
+    Text is scanned from left to right for opening delimiters.  At each one,
+    the text up to the closing delimiter is looked up as a name in the
+    table, so the time taken does not grow with the size of the table.  The
+    longest placeholder wins at each position, and replacement text is
+    never scanned again.
+    """
 
-        refuri = node.attributes.get("refuri")
-        if isinstance(refuri, str):
-            node["refuri"] = _apply_substitutions(
-                text=refuri,
-                substitution_defs=substitution_defs,
-                delimiter_pairs=delimiter_pairs,
+    def __init__(
+        self,
+        *,
+        substitution_defs: dict[str, str],
+        delimiter_pairs: set[tuple[str, str]],
+        statistics: _DocumentStatistics,
+    ) -> None:
+        """Compile patterns for the delimiters of the substitution table."""
+        self._statistics = statistics
+        self._substitution_defs = substitution_defs
+        self._delimiter_pairs = sorted(delimiter_pairs)
+        self._opening_delimiters = sorted(
+            {opening_delimiter for opening_delimiter, _ in delimiter_pairs},
+        )
+        self._opening_pattern = re.compile(
+            pattern="|".join(
+                re.escape(pattern=opening_delimiter)
+                for opening_delimiter in self._opening_delimiters
+            ),
+        )
+        self.can_match_newline = any(
+            "\n" in opening_delimiter or "\n" in closing_delimiter
+            for opening_delimiter, closing_delimiter in delimiter_pairs
+        ) or any("\n" in name for name in substitution_defs)
+
+        # A name without the first character of the closing delimiter ends
+        # just before the first such character, so one bounded match for
+        # each delimiter pair finds the only name which can be at a
+        # position.
+        max_name_length = max(
+            (len(name) for name in substitution_defs),
+            default=0,
+        )
+        self._name_patterns = [
+            re.compile(
+                pattern=(
+                    re.escape(pattern=opening_delimiter)
+                    + "([^"
+                    + re.escape(pattern=closing_delimiter[0])
+                    + "]{0,"
+                    + str(object=max_name_length)
+                    + "})"
+                    + re.escape(pattern=closing_delimiter)
+                ),
             )
-
-
-@beartype
-class SubstitutionCodeBlock(CodeBlock):
-    """Similar to CodeBlock but replaces placeholders with variables."""
-
-    option_spec: ClassVar[OptionSpec] = (
-        CodeBlock.option_spec.copy() if CodeBlock.option_spec else {}
-    )
-    option_spec[SUBSTITUTION_OPTION_NAME] = directives.flag
-    option_spec[NO_SUBSTITUTION_OPTION_NAME] = directives.flag
-
-    def run(self) -> list[Node]:
-        """Replace placeholders with given variables."""
-        new_content = StringList()
-        existing_content = self.content
-        myst_config = _get_myst_config(context=self.state)
-        substitution_defs = _get_substitution_defs(
-            env=self.env,
-            config=self.config,
-            substitution_defs=self.state.document.substitution_defs,
-            myst_config=myst_config,
+            for opening_delimiter, closing_delimiter in self._delimiter_pairs
+        ]
+
+        # Names which contain that character are rare, and are matched with
+        # an alternation of their placeholders.  Python's regular expression
+        # alternation takes the first branch which matches, so longer
+        # placeholders must come first.
+        self._other_replacements = {
+            f"{opening_delimiter}{name}{closing_delimiter}": replacement
+            for name, replacement in substitution_defs.items()
+            for opening_delimiter, closing_delimiter in self._delimiter_pairs
+            if closing_delimiter[0] in name
+        }
+        other_placeholders = sorted(
+            self._other_replacements,
+            key=lambda placeholder: (-len(placeholder), placeholder),
         )
-
-        delimiter_pairs = _get_delimiter_pairs(
-            env=self.env,
-            config=self.config,
-            myst_config=myst_config,
+        self._other_pattern: re.Pattern[str] | None = (
+            re.compile(
+                pattern="|".join(
+                    re.escape(pattern=placeholder)
+                    for placeholder in other_placeholders
+                ),
+            )
+            if other_placeholders
+            else None
         )
 
-        should_apply_substitutions = _should_apply_substitutions(
-            options=self.options,
-            config=self.config,
-            yes_flag=SUBSTITUTION_OPTION_NAME,
-            no_flag=NO_SUBSTITUTION_OPTION_NAME,
+    @cached_property
+    def fingerprint(self) -> str:
+        """A digest which is equal for matchers with equal tables."""
+        table = json.dumps(
+            obj=[
+                self._delimiter_pairs,
+                sorted(self._substitution_defs.items()),
+            ],
         )
+        return _get_digest(text=table)
 
-        for item in existing_content:
-            new_item = item
-            if should_apply_substitutions:
-                new_item = _apply_substitutions(
-                    text=item,
-                    substitution_defs=substitution_defs,
-                    delimiter_pairs=delimiter_pairs,
+    def with_statistics(
+        self,
+        *,
+        statistics: _DocumentStatistics,
+    ) -> "_SubstitutionMatcher":
+        """Get a matcher for the same table which counts texts in other
+        statistics.
+        """
+        matcher = copy.copy(x=self)
+        matcher._statistics = statistics  # noqa: SLF001
+        return matcher
+
+    def apply(self, *, text: str) -> str:
+        """Apply substitutions to text."""
+        self._statistics.texts += 1
+        if not self._substitution_defs or not any(
+            opening_delimiter in text
+            for opening_delimiter in self._opening_delimiters
+        ):
+            self._statistics.skipped += 1
+            return text
+
+        parts: list[str] = []
+        position = 0
+        opening_match = self._opening_pattern.search(string=text)
+        while opening_match is not None:
+            start = opening_match.start()
+            end = -1
+            replacement = None
+            for name_pattern in self._name_patterns:
+                match = name_pattern.match(string=text, pos=start)
+                if match is not None and match.end() > end:
+                    value = self._substitution_defs.get(match[1])
+                    if value is not None:
+                        end = match.end()
+                        replacement = value
+            if self._other_pattern is not None:
+                match = self._other_pattern.match(string=text, pos=start)
+                if match is not None and match.end() > end:
+                    end = match.end()
+                    replacement = self._other_replacements[match[0]]
+
+            if replacement is None:
+                opening_match = self._opening_pattern.search(
+                    string=text,
+                    pos=start + 1,
                 )
-            new_item_string_list = StringList(initlist=[new_item])
-            new_content.extend(other=new_item_string_list)
+                continue
+            parts.append(text[position:start])
+            parts.append(replacement)
+            position = end
+            opening_match = self._opening_pattern.search(
+                string=text,
+                pos=position,
+            )
 
-        self.content = new_content
-        return super().run()
+        if not parts:
+            return text
+        parts.append(text[position:])
+        new_text = "".join(parts)
+        self._statistics.placeholders += len(parts) // 2
+        self._statistics.rewritten_characters += len(new_text)
+        return new_text
 
 
-@beartype
-class SubstitutionCodeRole:
-    """Custom role for substitution code."""
+# The number of resolved placeholders remembered by each lazy matcher.
+_LAZY_RESOLUTION_CACHE_SIZE = 1024
 
-    options: ClassVar[dict[str, Any]] = {
-        "class": directives.class_option,
-        "language": directives.unchanged,
-    }
 
-    def __call__(  # pylint: disable=dangerous-default-value
+# NOTE: beartype is not used here
+# because it throws `beartype.roar.BeartypeCallHintForwardRefException`
+# for recursive type `Substitutions`
+class _LazySubstitutionMatcher:
+    """Apply nested substitutions to text without flattening them.
+
+    A placeholder such as ``|items.3.name|`` is resolved by walking its
+    dotted path through the nested substitutions when it is found. Resolved
+    placeholders are memoized in a bounded cache.
+
+    Placeholder names cannot contain whitespace or the first character of
+    the closing delimiter. Placeholders which do not resolve to a value are
+    left unchanged.
+    """
+
+    def __init__(
         self,
-        typ: str,
-        rawtext: str,
-        text: str,
-        lineno: int,
-        inliner: Inliner | MockInliner,
         *,
-        # We allow mutable defaults as the Sphinx implementation requires it.
-        options: dict[Any, Any] = {},  # noqa: B006
-        content: list[str] = [],  # noqa: B006
-    ) -> tuple[list[Node], list[system_message]]:
-        """Replace placeholders with given variables."""
-        settings = inliner.document.settings
-        env = settings.env
-        myst_config = _get_myst_config(context=inliner)
-        substitution_defs = _get_substitution_defs(
-            env=env,
-            config=env.config,
-            substitution_defs=inliner.document.substitution_defs,
-            myst_config=myst_config,
-        )
+        substitutions: Substitutions,
+        substitutions_digest: str,
+        delimiter_pairs: set[tuple[str, str]],
+        statistics: _DocumentStatistics,
+    ) -> None:
+        """Compile a pattern which matches any placeholder.
 
-        delimiter_pairs = _get_delimiter_pairs(
-            env=env,
-            config=env.config,
-            myst_config=myst_config,
+        ``substitutions_digest`` is the digest of ``substitutions`` from
+        :func:`_get_substitutions_digest`, which is computed once for the
+        global substitutions.
+        """
+        self._statistics = statistics
+        self._substitutions_digest = substitutions_digest
+        self._opening_delimiters = sorted(
+            {opening_delimiter for opening_delimiter, _ in delimiter_pairs},
         )
-
-        text = _apply_substitutions(
-            text=text,
-            substitution_defs=substitution_defs,
-            delimiter_pairs=delimiter_pairs,
+        self._delimiter_pairs = sorted(delimiter_pairs)
+        # Placeholder names cannot contain whitespace.
+        self.can_match_newline = any(
+            "\n" in opening_delimiter or "\n" in closing_delimiter
+            for opening_delimiter, closing_delimiter in delimiter_pairs
         )
-        rawtext = _apply_substitutions(
-            text=rawtext,
-            substitution_defs=substitution_defs,
-            delimiter_pairs=delimiter_pairs,
+        self._substitutions = substitutions
+        patterns = [
+            (
+                re.escape(pattern=opening_delimiter)
+                + "(?P<path"
+                + str(object=index)
+                + r">[^\s"
+                + re.escape(pattern=closing_delimiter[0])
+                + "]+)"
+                + re.escape(pattern=closing_delimiter)
+            )
+            for index, (opening_delimiter, closing_delimiter) in enumerate(
+                iterable=self._delimiter_pairs,
+            )
+        ]
+        self._pattern = re.compile(pattern="|".join(patterns))
+        self._resolve = lru_cache(maxsize=_LAZY_RESOLUTION_CACHE_SIZE)(
+            self._resolve_path,
         )
 
-        # ``types-docutils`` says that ``code_role`` requires an ``Inliner``
-        # for ``inliner``.
-        #
-        # We can remove this when
-        # https://github.com/executablebooks/MyST-Parser/issues/1017
-        # is resolved by typing ``inliner`` as ``Inliner``.
-        if isinstance(inliner, MockInliner):
-            new_inliner = Inliner()
-            new_inliner.document = inliner.document
-            inliner = new_inliner
-
-        return code_role(
-            role=typ,
-            rawtext=rawtext,
-            text=text,
-            lineno=lineno,
-            inliner=inliner,
-            options=options,
-            content=content,
+    @cached_property
+    def fingerprint(self) -> str:
+        """A digest which is equal for matchers with equal tables."""
+        table = json.dumps(
+            obj=[self._delimiter_pairs, self._substitutions_digest],
         )
+        return _get_digest(text=table)
 
+    def with_statistics(
+        self,
+        *,
+        statistics: _DocumentStatistics,
+    ) -> "_LazySubstitutionMatcher":
+        """Get a matcher for the same substitutions which counts texts in
+        other statistics.  Resolved placeholders are shared.
+        """
+        matcher = copy.copy(x=self)
+        matcher._statistics = statistics  # noqa: SLF001
+        return matcher
+
+    def _resolve_path(self, path: str) -> str | None:
+        """Walk a dotted path through the nested substitutions."""
+        value: SubstitutionValue = self._substitutions
+        for part in path.split(sep="."):
+            match value:
+                case dict() if part in value:
+                    value = value[part]
+                case list() if part.isdecimal() and int(part) < len(value):
+                    # Match the keys made by flattening, such as ``items.0``
+                    # but not ``items.00``.
+                    if str(object=int(part)) != part:
+                        return None
+                    value = value[int(part)]
+                case _:
+                    return None
+
+        if isinstance(value, (dict, list)):
+            return None
+        return str(object=value)
+
+    def apply(self, *, text: str) -> str:
+        """Apply substitutions to text."""
+        self._statistics.texts += 1
+        if not any(
+            opening_delimiter in text
+            for opening_delimiter in self._opening_delimiters
+        ):
+            self._statistics.skipped += 1
+            return text
+
+        parts: list[str] = []
+        position = 0
+        match = self._pattern.search(string=text)
+        while match is not None:
+            assert match.lastgroup is not None
+            replacement = self._resolve(match[match.lastgroup])
+            if replacement is None:
+                # The closing delimiter may start another placeholder.
+                match = self._pattern.search(
+                    string=text,
+                    pos=match.start() + 1,
+                )
+                continue
+            parts.append(text[position : match.start()])
+            parts.append(replacement)
+            position = match.end()
+            match = self._pattern.search(string=text, pos=position)
 
-@beartype
-class SubstitutionLiteralInclude(LiteralInclude):
-    """
-    Similar to LiteralInclude but replaces placeholders with
-    variables.
-    """
+        if not parts:
+            return text
+        parts.append(text[position:])
+        new_text = "".join(parts)
+        self._statistics.placeholders += len(parts) // 2
+        self._statistics.rewritten_characters += len(new_text)
+        return new_text
 
-    option_spec: ClassVar[OptionSpec] = (
-        LiteralInclude.option_spec.copy() if LiteralInclude.option_spec else {}
-    )
-    option_spec[CONTENT_SUBSTITUTION_OPTION_NAME] = directives.flag
-    option_spec[PATH_SUBSTITUTION_OPTION_NAME] = directives.flag
-    option_spec[NO_CONTENT_SUBSTITUTION_OPTION_NAME] = directives.flag
-    option_spec[NO_PATH_SUBSTITUTION_OPTION_NAME] = directives.flag
 
-    def run(self) -> list[Node]:
-        """
-        Replace placeholders with given variables in the file path
-        and/or
-        included file content.
-        """
-        myst_config = _get_myst_config(context=self.state)
-        should_apply_path_substitutions = _should_apply_substitutions(
-            options=self.options,
-            config=self.config,
-            yes_flag=PATH_SUBSTITUTION_OPTION_NAME,
-            no_flag=NO_PATH_SUBSTITUTION_OPTION_NAME,
-        )
+_Matcher: TypeAlias = _SubstitutionMatcher | _LazySubstitutionMatcher
 
-        if should_apply_path_substitutions:
-            substitution_defs = _get_substitution_defs(
-                env=self.env,
-                config=self.config,
-                substitution_defs=self.state.document.substitution_defs,
-                myst_config=myst_config,
-            )
+# The number of characters of substituted file contents kept for later
+# documents.  Larger contents are not kept.
+_CONTENT_CACHE_MAX_CHARACTERS = 64 * 1024 * 1024
 
-            delimiter_pairs = _get_delimiter_pairs(
-                env=self.env,
-                config=self.config,
-                myst_config=myst_config,
-            )
 
-            for argument_index, argument in enumerate(iterable=self.arguments):
-                self.arguments[argument_index] = _apply_substitutions(
-                    text=argument,
-                    substitution_defs=substitution_defs,
-                    delimiter_pairs=delimiter_pairs,
-                )
+@beartype(conf=_BEARTYPE_CONF)
+class _ContentCache:
+    """Substituted file contents by a digest of the substitution table and
+    the content, least recently used first.
 
-        nodes_list = super().run()
+    A lock is held while the cache is read or changed, so that a lookup and
+    the move which marks the entry as recently used, or an insertion and the
+    evictions which follow it, are not interleaved with those of builds in
+    other threads.
+    """
 
-        should_apply_content_substitutions = _should_apply_substitutions(
-            options=self.options,
-            config=self.config,
-            yes_flag=CONTENT_SUBSTITUTION_OPTION_NAME,
-            no_flag=NO_CONTENT_SUBSTITUTION_OPTION_NAME,
-        )
+    def __init__(self) -> None:
+        """Start with no contents."""
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._characters = 0
+        self._lock = threading.Lock()
+
+    def get(self, *, digest: str) -> str | None:
+        """Get substituted content, if it is in the cache."""
+        with self._lock:
+            text = self._entries.get(digest)
+            if text is not None:
+                self._entries.move_to_end(key=digest)
+        return text
+
+    def add(self, *, digest: str, text: str) -> None:
+        """Add substituted content, evicting the least recently used
+        contents until the cache is within its size limit.
+        """
+        if len(text) > _CONTENT_CACHE_MAX_CHARACTERS:
+            return
+        with self._lock:
+            # Builds in other threads may have added the same content.
+            self._characters += len(text) - len(self._entries.get(digest, ""))
+            self._entries[digest] = text
+            while self._characters > _CONTENT_CACHE_MAX_CHARACTERS:
+                _, evicted_text = self._entries.popitem(last=False)
+                self._characters -= len(evicted_text)
 
-        if should_apply_content_substitutions:
-            substitution_defs = _get_substitution_defs(
-                env=self.env,
-                config=self.config,
-                substitution_defs=self.state.document.substitution_defs,
-                myst_config=myst_config,
-            )
 
-            delimiter_pairs = _get_delimiter_pairs(
-                env=self.env,
-                config=self.config,
-                myst_config=myst_config,
-            )
+# This is shared by the documents read in a process, and parallel read
+# workers inherit it when they are forked.
+_CONTENT_CACHE = _ContentCache()
 
-            for node in nodes_list:
-                assert isinstance(node, Element)
-                _process_node(
-                    node=node,
-                    source_path=None,
-                    substitution_defs=substitution_defs,
-                    delimiter_pairs=delimiter_pairs,
-                )
 
-        return nodes_list
+# The directory in the doctree directory which holds the on-disk cache of
+# substituted file contents.
+_DISK_CACHE_DIRECTORY_NAME = "substitution-cache"
 
 
-@beartype
-class SubstitutionInclude(Include):
-    """
-    Similar to Include but replaces placeholders with variables in the
-    path.
-    """
+@beartype(conf=_BEARTYPE_CONF)
+class _CachedMatcher:
+    """Apply a matcher to the whole content of included files, reusing the
+    result for the same content and substitution table in other documents.
+    Smaller texts, such as captions, are given to the matcher itself so
+    that they do not evict file contents from the cache.
 
-    option_spec: ClassVar[OptionSpec | None] = {
-        **(Include.option_spec or {}),
-        CONTENT_SUBSTITUTION_OPTION_NAME: directives.flag,
-        PATH_SUBSTITUTION_OPTION_NAME: directives.flag,
-        NO_CONTENT_SUBSTITUTION_OPTION_NAME: directives.flag,
-        NO_PATH_SUBSTITUTION_OPTION_NAME: directives.flag,
-    }
+    If ``disk_cache_directory`` is given, results are also reused from
+    earlier builds.  Files there are named by a digest of the substitution
+    table and the content, and are written atomically, so parallel read
+    workers can share the directory.
 
-    def _run_with_include_read(
-        self,
+    Texts served from a cache are counted as cache hits, not as texts given
+    to the matcher.
+    """
+
+    def __init__(
+        self,
+        *,
+        matcher: _Matcher,
+        statistics: _DocumentStatistics,
+        disk_cache_directory: Path | None,
+    ) -> None:
+        """Wrap a matcher."""
+        self._matcher = matcher
+        self._statistics = statistics
+        self._disk_cache_directory = disk_cache_directory
+
+    def _apply_with_disk_cache(
+        self,
+        *,
+        disk_cache_directory: Path,
+        digest: str,
+        text: str,
+    ) -> str:
+        """Apply substitutions, reusing a result from an earlier build."""
+        path = disk_cache_directory / digest[:2] / digest
+        try:
+            new_text = path.read_bytes().decode()
+        except FileNotFoundError:
+            pass
+        else:
+            self._statistics.disk_cache_hits += 1
+            # Eviction removes the least recently used files first.
+            path.touch()
+            return new_text
+
+        self._statistics.disk_cache_misses += 1
+        new_text = self._matcher.apply(text=text)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            mode="wb",
+            suffix=".tmp",
+            dir=path.parent,
+            delete=False,
+        ) as temporary_file:
+            temporary_file.write(new_text.encode())
+        Path(temporary_file.name).replace(target=path)
+        return new_text
+
+    def apply(self, *, text: str) -> str:
+        """Apply substitutions to text."""
+        digest = _get_digest(text=f"{self._matcher.fingerprint}\0{text}")
+        new_text = _CONTENT_CACHE.get(digest=digest)
+        if new_text is not None:
+            self._statistics.content_cache_hits += 1
+            return new_text
+
+        self._statistics.content_cache_misses += 1
+        if self._disk_cache_directory is None:
+            new_text = self._matcher.apply(text=text)
+        else:
+            new_text = self._apply_with_disk_cache(
+                disk_cache_directory=self._disk_cache_directory,
+                digest=digest,
+                text=text,
+            )
+        _CONTENT_CACHE.add(digest=digest, text=new_text)
+        return new_text
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _get_cached_matcher(
+    *,
+    env: BuildEnvironment,
+    matcher: _Matcher,
+) -> _CachedMatcher:
+    """Get a matcher for included file content in the document being
+    read.
+    """
+    disk_cache_directory = None
+    if env.config.substitutions_disk_cache_enabled:
+        disk_cache_directory = (
+            Path(env.doctreedir) / _DISK_CACHE_DIRECTORY_NAME
+        )
+    return _CachedMatcher(
+        matcher=matcher,
+        statistics=_get_document_statistics(env=env),
+        disk_cache_directory=disk_cache_directory,
+    )
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _evict_disk_cache(app: Sphinx, exception: BaseException | None) -> None:
+    """Remove the least recently used files from the on-disk cache until
+    it fits in ``substitutions_disk_cache_max_bytes``.
+
+    This runs once the build has finished, when no read workers are using
+    the cache.
+    """
+    if (
+        exception is not None
+        or not app.config.substitutions_disk_cache_enabled
+    ):
+        return
+
+    disk_cache_directory = Path(app.doctreedir) / _DISK_CACHE_DIRECTORY_NAME
+    files = [
+        (path.stat(), path)
+        for path in disk_cache_directory.rglob(pattern="*")
+        if path.is_file()
+    ]
+    files.sort(key=lambda item: item[0].st_mtime_ns, reverse=True)
+    total_bytes = 0
+    for stat_result, path in files:
+        total_bytes += stat_result.st_size
+        if total_bytes > app.config.substitutions_disk_cache_max_bytes:
+            path.unlink(missing_ok=True)
+
+
+@beartype(conf=_BEARTYPE_CONF)
+class _SubstitutionContext:
+    """Substitution setup shared by the directives and roles in a
+    document.
+    """
+
+    def __init__(
+        self,
+        *,
+        env: BuildEnvironment,
+        document_substitution_defs: dict[str, substitution_definition],
+        myst_config: MdParserConfig | None,
+        statistics: _DocumentStatistics,
+    ) -> None:
+        """Resolve the substitution table and compile its matcher."""
+        self.myst_config = myst_config
+        self._document_substitution_defs = dict(document_substitution_defs)
+        self.delimiter_pairs = _get_delimiter_pairs(
+            env=env,
+            config=env.config,
+            myst_config=myst_config,
+        )
+
+        myst_substitutions = None
+        is_markdown = _is_markdown_parser(env=env, config=env.config)
+        if is_markdown:
+            _note_config_dependency(
+                env=env,
+                name="substitutions_lazy_resolution_enabled",
+            )
+        if env.config.substitutions_lazy_resolution_enabled and is_markdown:
+            myst_substitutions = _get_myst_substitutions(
+                config=env.config,
+                myst_config=myst_config,
+            )
+
+        self.matcher: _Matcher
+        if myst_substitutions is None:
+            self.matcher = _SubstitutionMatcher(
+                substitution_defs=_get_substitution_defs(
+                    env=env,
+                    config=env.config,
+                    substitution_defs=document_substitution_defs,
+                    myst_config=myst_config,
+                ),
+                delimiter_pairs=self.delimiter_pairs,
+                statistics=statistics,
+            )
+        else:
+            substitutions_digest = _MYST_SUBSTITUTIONS_DIGESTS.get(
+                key=env.config,
+            )
+            if (
+                substitutions_digest is None
+                or myst_substitutions is not env.config.myst_substitutions
+            ):
+                # MyST front matter has replaced the global substitutions.
+                substitutions_digest = _get_substitutions_digest(
+                    substitutions=myst_substitutions,
+                )
+            self.matcher = _LazySubstitutionMatcher(
+                substitutions=myst_substitutions,
+                substitutions_digest=substitutions_digest,
+                delimiter_pairs=self.delimiter_pairs,
+                statistics=statistics,
+            )
+
+    def is_current(
+        self,
+        *,
+        document_substitution_defs: dict[str, substitution_definition],
+    ) -> bool:
+        """Whether the document's substitution definitions are unchanged.
+
+        reST substitution definitions are added to the document as it is
+        parsed, so a directive after a new definition needs a new table.
+        """
+        return self._document_substitution_defs == document_substitution_defs
+
+
+# Statistics are stored on the environment by document name so that they are
+# pickled with it, and so that parallel read workers can send them back.
+_STATISTICS_ATTRIBUTE = "sphinx_substitution_extensions_statistics"
+
+# The file in the output directory which instrumentation statistics are
+# written to.
+_STATISTICS_FILENAME = "substitution-statistics.json"
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _get_all_statistics(
+    *,
+    env: BuildEnvironment,
+) -> dict[str, _DocumentStatistics]:
+    """Get the statistics for every document in the environment."""
+    all_statistics: dict[str, _DocumentStatistics] = vars(env).setdefault(
+        _STATISTICS_ATTRIBUTE,
+        {},
+    )
+    return all_statistics
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _get_document_statistics(*, env: BuildEnvironment) -> _DocumentStatistics:
+    """Get the statistics for the document being read."""
+    return _get_all_statistics(env=env).setdefault(
+        env.docname,
+        _DocumentStatistics(),
+    )
+
+
+@contextmanager
+@beartype(conf=_BEARTYPE_CONF)
+def _instrumented(*, env: BuildEnvironment, component: str) -> Generator[None]:
+    """Record the time taken by a directive, role or pass, and the
+    placeholders it replaced, when instrumentation is enabled.
+    """
+    if not env.config.substitutions_instrumentation_enabled:
+        yield
+        return
+
+    statistics = _get_document_statistics(env=env)
+    placeholders = statistics.placeholders
+    rewritten_characters = statistics.rewritten_characters
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        statistics.components.setdefault(
+            component,
+            _ComponentStatistics(),
+        ).record(
+            seconds=time.perf_counter() - start,
+            placeholders=statistics.placeholders - placeholders,
+            rewritten_characters=(
+                statistics.rewritten_characters - rewritten_characters
+            ),
+        )
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _purge_statistics(
+    _app: Sphinx,
+    env: BuildEnvironment,
+    docname: str,
+) -> None:
+    """Forget the statistics for a document which will be read again."""
+    _get_all_statistics(env=env).pop(docname, None)
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _merge_statistics(
+    _app: Sphinx,
+    env: BuildEnvironment,
+    docnames: AbstractSet[str],
+    other: BuildEnvironment,
+) -> None:
+    """Merge statistics from a parallel read worker."""
+    all_statistics = _get_all_statistics(env=env)
+    other_statistics = _get_all_statistics(env=other)
+    for docname in docnames & other_statistics.keys():
+        all_statistics[docname] = other_statistics[docname]
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _log_scan_counts(app: Sphinx, _exception: BaseException | None) -> None:
+    """Log how often texts were skipped without a placeholder scan."""
+    all_statistics = _get_all_statistics(env=app.env).values()
+    texts = sum(statistics.texts for statistics in all_statistics)
+    if not texts:
+        return
+    skipped = sum(statistics.skipped for statistics in all_statistics)
+    _LOGGER.verbose(
+        "Substitution pre-scan skipped %d of %d texts (%.1f%%)",
+        skipped,
+        texts,
+        100 * skipped / texts,
+    )
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _write_statistics(app: Sphinx, exception: BaseException | None) -> None:
+    """Write instrumentation statistics to the output directory."""
+    if (
+        exception is not None
+        or not app.config.substitutions_instrumentation_enabled
+    ):
+        return
+
+    all_statistics = _get_all_statistics(env=app.env)
+    total = _DocumentStatistics()
+    for statistics in all_statistics.values():
+        total.add(other=statistics)
+    report = {
+        "total": total.to_json(),
+        "documents": {
+            docname: statistics.to_json()
+            for docname, statistics in sorted(all_statistics.items())
+        },
+    }
+    (Path(app.outdir) / _STATISTICS_FILENAME).write_text(
+        data=json.dumps(obj=report, indent=2) + "\n",
+    )
+
+
+# Configuration values which change how documents are read.  These are
+# registered without a rebuild type, and documents are only read again when a
+# value which they depend on changes.
+_READ_CONFIG_NAMES = (
+    "substitutions_default_enabled",
+    "substitutions_hyperlink_targets_enabled",
+    "substitutions_lazy_resolution_enabled",
+    "substitutions_source_read_enabled",
+)
+
+# The names in ``_READ_CONFIG_NAMES`` which each document depended on when it
+# was read, by document name.  Like statistics, these are stored on the
+# environment.
+_CONFIG_DEPENDENCIES_ATTRIBUTE = (
+    "sphinx_substitution_extensions_config_dependencies"
+)
+
+# The values of ``_READ_CONFIG_NAMES`` when documents were last read.
+_READ_CONFIG_VALUES_ATTRIBUTE = (
+    "sphinx_substitution_extensions_read_config_values"
+)
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _get_all_config_dependencies(
+    *,
+    env: BuildEnvironment,
+) -> dict[str, set[str]]:
+    """Get the configuration dependencies of every document."""
+    all_dependencies: dict[str, set[str]] = vars(env).setdefault(
+        _CONFIG_DEPENDENCIES_ATTRIBUTE,
+        {},
+    )
+    return all_dependencies
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _note_config_dependency(*, env: BuildEnvironment, name: str) -> None:
+    """Record that the document being read depends on a configuration
+    value.
+    """
+    _get_all_config_dependencies(env=env).setdefault(env.docname, set()).add(
+        name,
+    )
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _purge_config_dependencies(
+    _app: Sphinx,
+    env: BuildEnvironment,
+    docname: str,
+) -> None:
+    """Forget the dependencies of a document which will be read again."""
+    _get_all_config_dependencies(env=env).pop(docname, None)
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _merge_config_dependencies(
+    _app: Sphinx,
+    env: BuildEnvironment,
+    docnames: AbstractSet[str],
+    other: BuildEnvironment,
+) -> None:
+    """Merge configuration dependencies from a parallel read worker."""
+    all_dependencies = _get_all_config_dependencies(env=env)
+    other_dependencies = _get_all_config_dependencies(env=other)
+    for docname in docnames & other_dependencies.keys():
+        all_dependencies[docname] = other_dependencies[docname]
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _get_config_outdated_documents(
+    _app: Sphinx,
+    env: BuildEnvironment,
+    _added: AbstractSet[str],
+    _changed: AbstractSet[str],
+    removed: AbstractSet[str],
+) -> list[str]:
+    """Get the documents which depend on a changed configuration value.
+
+    The values are compared with those stored when documents were last
+    read.  A new environment has no stored values, and every document is
+    read anyway.
+    """
+    config_values = {name: env.config[name] for name in _READ_CONFIG_NAMES}
+    previous_config_values: dict[str, object] | None = vars(env).get(
+        _READ_CONFIG_VALUES_ATTRIBUTE,
+    )
+    vars(env)[_READ_CONFIG_VALUES_ATTRIBUTE] = config_values
+    if previous_config_values is None:
+        return []
+
+    changed_names = {
+        name
+        for name, value in config_values.items()
+        if previous_config_values.get(name) != value
+    }
+    return sorted(
+        docname
+        for docname, dependencies in _get_all_config_dependencies(
+            env=env,
+        ).items()
+        if docname not in removed
+        and not dependencies.isdisjoint(changed_names)
+    )
+
+
+# Sphinx discards its per-document temporary data after each document is
+# read, so contexts never outlive the document they were created for and are
+# never pickled with the environment.
+_SUBSTITUTION_CONTEXTS_KEY = "sphinx_substitution_extensions_contexts"
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _get_substitution_context(
+    *,
+    env: BuildEnvironment,
+    doctree: document,
+    myst_config: MdParserConfig | None,
+) -> _SubstitutionContext:
+    """Get the substitution context for the document being read.
+
+    The context is created on first use and reused until the document's
+    substitution definitions or the effective MyST configuration change.
+    """
+    if _SUBSTITUTION_CONTEXTS_KEY not in env.temp_data:
+        env.temp_data[_SUBSTITUTION_CONTEXTS_KEY] = {}
+    contexts: dict[int, _SubstitutionContext] = env.temp_data[
+        _SUBSTITUTION_CONTEXTS_KEY
+    ]
+    context = contexts.get(id(myst_config))
+    if (
+        context is None
+        or context.myst_config is not myst_config
+        or not context.is_current(
+            document_substitution_defs=doctree.substitution_defs,
+        )
+    ):
+        context = _SubstitutionContext(
+            env=env,
+            document_substitution_defs=doctree.substitution_defs,
+            myst_config=myst_config,
+            statistics=_get_document_statistics(env=env),
+        )
+        contexts[id(myst_config)] = context
+    return context
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _should_apply_substitutions(
+    *,
+    options: dict[str, Any],
+    env: BuildEnvironment,
+    yes_flag: str,
+    no_flag: str,
+) -> bool:
+    """
+    Whether substitutions should be applied based on flags and
+    configuration.
+    """
+    if no_flag in options:
+        return False
+    if yes_flag in options:
+        return True
+    _note_config_dependency(env=env, name="substitutions_default_enabled")
+    return bool(env.config.substitutions_default_enabled)
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _process_nodes(
+    *,
+    nodes: list[Node],
+    source_path: Path | None,
+    matcher: _Matcher,
+    content_matcher: _CachedMatcher | None,
+) -> None:
+    """Apply substitutions to nodes and their descendants.
+
+    If ``source_path`` is given, nodes from other sources are skipped along
+    with their descendants. ``rawsource`` values and ``Text`` children are
+    only replaced when a substitution changes them.  If ``content_matcher``
+    is given, it is used for literal blocks, which hold included file
+    content.
+    """
+    resolved_sources: dict[str, Path] = {}
+    stack: list[Element] = []
+    for node in nodes:
+        assert isinstance(node, Element)
+        stack.append(node)
+
+    while stack:
+        current_node = stack.pop()
+        if source_path is not None and current_node.source is not None:
+            resolved_source = resolved_sources.get(current_node.source)
+            if resolved_source is None:
+                resolved_source = Path(current_node.source).resolve()
+                resolved_sources[current_node.source] = resolved_source
+            if resolved_source != source_path:
+                continue
+
+        node_matcher: _Matcher | _CachedMatcher = (
+            content_matcher
+            if content_matcher is not None
+            and isinstance(current_node, literal_block)
+            else matcher
+        )
+
+        rawsource = node_matcher.apply(text=current_node.rawsource)
+        if rawsource is not current_node.rawsource:
+            current_node.rawsource = rawsource
+
+        for index, child in enumerate(iterable=current_node.children):
+            if isinstance(child, Text):
+                text = node_matcher.apply(text=child.astext())
+                if text != child:
+                    current_node[index] = Text(data=text)
+            else:
+                assert isinstance(child, Element)
+                stack.append(child)
+
+
+# The number of bytes of an included file which are decoded and substituted
+# at a time when its content is streamed.
+_STREAMING_CHUNK_SIZE = 1024 * 1024
+
+# ``literalinclude`` options which change the lines read from a file.  The
+# content of files included with these options is never streamed.
+_LINE_FILTER_OPTIONS = frozenset(
+    {
+        "append",
+        "dedent",
+        "diff",
+        "end-at",
+        "end-before",
+        "lines",
+        "prepend",
+        "pyobject",
+        "start-after",
+        "start-at",
+        "tab-width",
+    },
+)
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _apply_streaming(
+    *,
+    path: Path,
+    encoding: str,
+    matcher: _Matcher,
+) -> tuple[str, int]:
+    """Apply substitutions to the content of a file in bounded chunks, and
+    count the lines of the content as Sphinx does.
+
+    The file is memory-mapped and decoded a chunk at a time, with newlines
+    translated as they are when Sphinx reads the file, so the content is
+    never held in memory before it is substituted.  Text after the last
+    newline in a chunk is held back and substituted with the next chunk, so
+    placeholders which straddle chunk boundaries are replaced.  This is only
+    correct for matchers which cannot match a newline.
+    """
+    decoder = io.IncrementalNewlineDecoder(
+        decoder=codecs.getincrementaldecoder(encoding=encoding)(),
+        translate=True,
+    )
+    output = io.StringIO()
+    line_count = 0
+    pending = ""
+    with (
+        path.open(mode="rb") as file,
+        mmap.mmap(
+            fileno=file.fileno(),
+            length=0,
+            access=mmap.ACCESS_READ,
+        ) as buffer,
+    ):
+        for start in range(0, len(buffer), _STREAMING_CHUNK_SIZE):
+            text = pending + decoder.decode(
+                input=buffer[start : start + _STREAMING_CHUNK_SIZE],
+            )
+            end = text.rfind("\n") + 1
+            line_count += len(text[:end].splitlines())
+            output.write(matcher.apply(text=text[:end]))
+            pending = text[end:]
+    pending += decoder.decode(input=b"", final=True)
+    line_count += len(pending.splitlines())
+    output.write(matcher.apply(text=pending))
+    return output.getvalue(), line_count
+
+
+# The number of substituted hyperlink targets which are remembered between
+# documents.
+_HYPERLINK_TARGET_CACHE_SIZE = 4096
+
+
+@beartype(conf=_BEARTYPE_CONF)
+class _HyperlinkTargetCache:
+    """Substituted hyperlink targets by substitution table and target,
+    least recently used first.
+
+    The same URL templates are often used on many pages, and the pages
+    usually share one table, so substituted targets are kept between
+    documents.  As with the content cache, a lock is held while the cache
+    is read or changed, so that builds in other threads can share it.
+    """
+
+    def __init__(self) -> None:
+        """Start with no targets."""
+        self._entries: OrderedDict[tuple[str, str], str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, *, fingerprint: str, refuri: str) -> str | None:
+        """Get a substituted target, if it is in the cache."""
+        key = (fingerprint, refuri)
+        with self._lock:
+            substituted_refuri = self._entries.get(key)
+            if substituted_refuri is not None:
+                self._entries.move_to_end(key=key)
+        return substituted_refuri
+
+    def add(
+        self,
+        *,
+        fingerprint: str,
+        refuri: str,
+        substituted_refuri: str,
+    ) -> None:
+        """Add a substituted target, evicting the least recently used
+        targets until the cache is within its size limit.
+        """
+        with self._lock:
+            self._entries[fingerprint, refuri] = substituted_refuri
+            while len(self._entries) > _HYPERLINK_TARGET_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+
+# Like the content cache, this is shared by the documents read in a
+# process.
+_HYPERLINK_TARGET_CACHE = _HyperlinkTargetCache()
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _substitute_hyperlink_targets(
+    app: Sphinx,
+    doctree: document,
+) -> None:
+    """Replace placeholders in hyperlink targets.
+
+    Documents without a hyperlink target which contains an opening
+    delimiter are skipped before their substitution table is built. Each
+    distinct target is substituted once.
+    """
+    # Any document can contain a hyperlink target with a placeholder, so
+    # every document depends on this value.
+    _note_config_dependency(
+        env=app.env,
+        name="substitutions_hyperlink_targets_enabled",
+    )
+    if not app.config.substitutions_hyperlink_targets_enabled:
+        return
+
+    with _instrumented(env=app.env, component="hyperlink-targets"):
+        opening_delimiters = {
+            opening_delimiter
+            for opening_delimiter, _ in _get_delimiter_pairs(
+                env=app.env,
+                config=app.config,
+                myst_config=None,
+            )
+        }
+        nodes_by_refuri: dict[str, list[Element]] = {}
+        for node in doctree.findall(condition=Element):
+            if not isinstance(node, (reference, target_node)):
+                continue
+
+            refuri = node.get("refuri")
+            if isinstance(refuri, str) and any(
+                opening_delimiter in refuri
+                for opening_delimiter in opening_delimiters
+            ):
+                nodes_by_refuri.setdefault(refuri, []).append(node)
+
+        if not nodes_by_refuri:
+            return
+
+        matcher = _get_substitution_context(
+            env=app.env,
+            doctree=doctree,
+            myst_config=None,
+        ).matcher
+        for refuri, nodes in nodes_by_refuri.items():
+            substituted_refuri = _HYPERLINK_TARGET_CACHE.get(
+                fingerprint=matcher.fingerprint,
+                refuri=refuri,
+            )
+            if substituted_refuri is None:
+                substituted_refuri = matcher.apply(text=refuri)
+                _HYPERLINK_TARGET_CACHE.add(
+                    fingerprint=matcher.fingerprint,
+                    refuri=refuri,
+                    substituted_refuri=substituted_refuri,
+                )
+            for node in nodes:
+                node["refuri"] = substituted_refuri
+
+
+@beartype(conf=_BEARTYPE_CONF)
+class _ActiveInclude:
+    """An ``include`` directive whose file is being read."""
+
+    def __init__(
+        self, *, matcher: _CachedMatcher, arguments: list[str]
+    ) -> None:
+        """Start before Sphinx emits ``include-read`` for the file.
+
+        ``arguments`` are the directive's arguments.  Sphinx replaces the
+        path in them with the resolved path before the file is read.
+        """
+        self.matcher = matcher
+        self.include_read_emitted = False
+        self._arguments = arguments
+
+    def reads(self, *, srcdir: Path, relative_path: Path) -> bool:
+        """Whether this include reads the file which Sphinx gives
+        ``include-read`` listeners.
+        """
+        included_path = self._arguments[0]
+        # Sphinx gives the path with links resolved.  Resolving the included
+        # path is slower than joining, so it is only done when the paths
+        # differ.
+        joined_path = os.path.normpath(path=srcdir / relative_path)
+        if joined_path == included_path:
+            return True
+
+        relative_included_path = os.path.relpath(
+            path=Path(included_path).resolve(),
+            start=srcdir,
+        )
+        return Path(relative_included_path) == relative_path
+
+
+# Includes being read in the current document, innermost last.  A file can
+# include another file while it is read through a custom parser.  Like
+# substitution contexts, these are kept in Sphinx's per-document temporary
+# data.
+_ACTIVE_INCLUDES_KEY = "sphinx_substitution_extensions_active_includes"
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _get_active_includes(*, env: BuildEnvironment) -> list[_ActiveInclude]:
+    """Get the includes being read in the current document."""
+    if _ACTIVE_INCLUDES_KEY not in env.temp_data:
+        env.temp_data[_ACTIVE_INCLUDES_KEY] = []
+    active_includes: list[_ActiveInclude] = env.temp_data[_ACTIVE_INCLUDES_KEY]
+    return active_includes
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _substitute_include_content(
+    app: Sphinx,
+    relative_path: Path,
+    _parent_docname: str,
+    content: list[str],
+) -> None:
+    """Substitute included content changed by earlier listeners.
+
+    This only changes content read by a ``SubstitutionInclude`` which
+    applies content substitutions.
+    """
+    active_includes = _get_active_includes(env=app.env)
+    if not active_includes:
+        return
+
+    active_include = active_includes[-1]
+    if not active_include.reads(
+        srcdir=Path(app.srcdir),
+        relative_path=relative_path,
+    ):
+        return
+
+    active_include.include_read_emitted = True
+    content[0] = active_include.matcher.apply(text=content[0])
+
+
+# The ID of the ``include-read`` listener by the event manager to which it
+# is connected.
+_INCLUDE_READ_LISTENER_IDS: WeakKeyDictionary[EventManager, int] = (
+    WeakKeyDictionary()
+)
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _connect_include_read_listener(*, events: EventManager) -> None:
+    """Connect the ``include-read`` listener the first time an include
+    applies content substitutions.
+
+    Sphinx emits ``include-read`` for every include once any listener is
+    connected, so projects which do not substitute included content do not
+    pay for it.  The listener has a high priority so that it runs after
+    other listeners.
+    """
+    if events in _INCLUDE_READ_LISTENER_IDS:
+        return
+
+    _INCLUDE_READ_LISTENER_IDS[events] = events.connect(
+        name="include-read",
+        callback=_substitute_include_content,
+        priority=999,
+    )
+
+
+@beartype(conf=_BEARTYPE_CONF)
+class SubstitutionEngine:
+    """Apply substitutions to text and document trees, as this extension's
+    directives and roles do.
+
+    An engine compiles its substitution table once, and can be reused for
+    any number of texts.  Create one with :meth:`from_document` or
+    :meth:`from_definitions`.
+    """
+
+    def __init__(self, *, matcher: _Matcher) -> None:
+        """Wrap a matcher.  Use :meth:`from_document` or
+        :meth:`from_definitions` instead.
+        """
+        self._matcher = matcher
+
+    @classmethod
+    def from_document(
+        cls,
+        *,
+        env: BuildEnvironment,
+        doctree: document,
+    ) -> "SubstitutionEngine":
+        """Get an engine for the document being read.
+
+        This uses the substitutions which the extension's directives use at
+        this point in the document: the substitution definitions so far in
+        a reST document, or the global ``myst_substitutions`` and delimiters
+        in a Markdown document.  The compiled table is shared with the
+        directives and roles in the document, but texts given to the engine
+        are not counted in the document's statistics.
+
+        A :class:`~sphinx.errors.SphinxError` is raised if no document is
+        being read, for example in a ``doctree-resolved`` handler.
+        """
+        # Sphinx only has a parser for the current document while it is
+        # read.
+        try:
+            parser = env.parser
+        except KeyError as exc:
+            message = (
+                "A SubstitutionEngine can only be created from a document "
+                "while the document is read, such as in a doctree-read "
+                "handler. Use SubstitutionEngine.from_definitions at other "
+                "times."
+            )
+            raise SphinxError(message) from exc
+        del parser
+
+        matcher = _get_substitution_context(
+            env=env,
+            doctree=doctree,
+            myst_config=None,
+        ).matcher
+        return cls(
+            matcher=matcher.with_statistics(statistics=_DocumentStatistics()),
+        )
+
+    @classmethod
+    def from_definitions(
+        cls,
+        *,
+        substitution_defs: dict[str, str],
+        delimiter_pairs: AbstractSet[tuple[str, str]] = frozenset(
+            {("|", "|")},
+        ),
+    ) -> "SubstitutionEngine":
+        """Get an engine for substitution values by name, and pairs of
+        opening and closing delimiters around names.
+        """
+        return cls(
+            matcher=_SubstitutionMatcher(
+                substitution_defs=dict(substitution_defs),
+                delimiter_pairs=set(delimiter_pairs),
+                statistics=_DocumentStatistics(),
+            ),
+        )
+
+    def apply(self, *, text: str) -> str:
+        """Apply substitutions to text."""
+        return self._matcher.apply(text=text)
+
+    def apply_many(self, *, texts: Iterable[str]) -> list[str]:
+        """Apply substitutions to each of many texts."""
+        apply = self._matcher.apply
+        return [apply(text=text) for text in texts]
+
+    def apply_tree(self, *, node: Element) -> None:
+        """Apply substitutions to the raw source and text of a node and its
+        descendants, in place.
+        """
+        _process_nodes(
+            nodes=[node],
+            source_path=None,
+            matcher=self._matcher,
+            content_matcher=None,
+        )
+
+
+@beartype(conf=_BEARTYPE_CONF)
+class SubstitutionCodeBlock(CodeBlock):
+    """Similar to CodeBlock but replaces placeholders with variables."""
+
+    option_spec: ClassVar[OptionSpec] = (
+        CodeBlock.option_spec.copy() if CodeBlock.option_spec else {}
+    )
+    option_spec[SUBSTITUTION_OPTION_NAME] = directives.flag
+    option_spec[NO_SUBSTITUTION_OPTION_NAME] = directives.flag
+
+    def run(self) -> list[Node]:
+        """Replace placeholders with given variables."""
+        with _instrumented(env=self.env, component=type(self).__name__):
+            should_apply_substitutions = _should_apply_substitutions(
+                options=self.options,
+                env=self.env,
+                yes_flag=SUBSTITUTION_OPTION_NAME,
+                no_flag=NO_SUBSTITUTION_OPTION_NAME,
+            )
+            if not should_apply_substitutions:
+                return super().run()
+
+            myst_config = _get_myst_config(context=self.state)
+            matcher = _get_substitution_context(
+                env=self.env,
+                doctree=self.state.document,
+                myst_config=myst_config,
+            ).matcher
+
+            # The source and offset of each line are kept so that warnings
+            # about the block refer to the right lines.
+            self.content = StringList(
+                initlist=[
+                    matcher.apply(text=line) for line in self.content.data
+                ],
+                items=list(self.content.items),
+            )
+            return super().run()
+
+
+@runtime_checkable
+class _InlinerWithDocument(Protocol):
+    """An inliner, such as MyST's ``MockInliner``, which has a document.
+
+    This is used instead of ``MockInliner`` so that MyST's parser is not
+    imported for projects which only use reST. beartype's ``Protocol`` caches
+    ``isinstance`` checks, which are otherwise slow for protocols.
+    """
+
+    document: document
+
+
+@beartype(conf=_BEARTYPE_CONF)
+class _InlinerAdapter:
+    """A docutils ``Inliner`` to use in place of MyST's inliners in a
+    document, and the MyST configuration which they share.
+
+    MyST creates a new inliner for every role in a document, so the adapter
+    is created once and reused by later roles in the same document.
+    """
+
+    def __init__(self, *, inliner: _InlinerWithDocument) -> None:
+        """Create an ``Inliner`` for the document of ``inliner``."""
+        self.myst_config = _get_myst_config(context=inliner)
+        self.inliner = Inliner()
+        self.inliner.document = inliner.document
+
+
+# The inliner adapter for the document being read.  Like substitution
+# contexts, this is kept in Sphinx's per-document temporary data, so it is
+# never shared between documents.
+_INLINER_ADAPTER_KEY = "sphinx_substitution_extensions_inliner_adapter"
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _get_inliner_adapter(
+    *,
+    env: BuildEnvironment,
+    inliner: _InlinerWithDocument,
+) -> _InlinerAdapter:
+    """Get an inliner adapter for the document of ``inliner``."""
+    if _INLINER_ADAPTER_KEY not in env.temp_data:
+        env.temp_data[_INLINER_ADAPTER_KEY] = _InlinerAdapter(inliner=inliner)
+    adapter: _InlinerAdapter = env.temp_data[_INLINER_ADAPTER_KEY]
+    return adapter
+
+
+@beartype(conf=_BEARTYPE_CONF)
+class SubstitutionCodeRole:
+    """Custom role for substitution code."""
+
+    options: ClassVar[dict[str, Any]] = {
+        "class": directives.class_option,
+        "language": directives.unchanged,
+    }
+
+    def __call__(  # pylint: disable=dangerous-default-value
+        self,
+        typ: str,
+        rawtext: str,
+        text: str,
+        lineno: int,
+        inliner: Inliner | _InlinerWithDocument,
+        *,
+        # We allow mutable defaults as the Sphinx implementation requires it.
+        options: dict[Any, Any] = {},  # noqa: B006
+        content: list[str] = [],  # noqa: B006
+    ) -> tuple[list[Node], list[system_message]]:
+        """Replace placeholders with given variables."""
+        settings = inliner.document.settings
+        env = settings.env
+        with _instrumented(env=env, component=type(self).__name__):
+            # ``types-docutils`` says that ``code_role`` requires an
+            # ``Inliner`` for ``inliner``.
+            #
+            # We can remove this when
+            # https://github.com/executablebooks/MyST-Parser/issues/1017
+            # is resolved by typing ``inliner`` as ``Inliner``.
+            myst_config = None
+            if not isinstance(inliner, Inliner):
+                adapter = _get_inliner_adapter(env=env, inliner=inliner)
+                myst_config = adapter.myst_config
+                inliner = adapter.inliner
+
+            matcher = _get_substitution_context(
+                env=env,
+                doctree=inliner.document,
+                myst_config=myst_config,
+            ).matcher
+
+            text = matcher.apply(text=text)
+            rawtext = matcher.apply(text=rawtext)
+
+            return code_role(
+                role=typ,
+                rawtext=rawtext,
+                text=text,
+                lineno=lineno,
+                inliner=inliner,
+                options=options,
+                content=content,
+            )
+
+
+@beartype(conf=_BEARTYPE_CONF)
+class _SubstitutionLiteralIncludeReader(LiteralIncludeReader):
+    """Read a file for ``literalinclude``, replacing placeholders before
+    options such as ``:start-after:`` select lines.
+
+    If ``streaming_matcher`` is given, the file is instead read and
+    substituted a chunk at a time with :func:`_apply_streaming`.  This is
+    only correct when no option selects or changes lines.
+    """
+
+    def __init__(
+        self,
+        *,
+        filename: str,
+        options: dict[str, Any],
+        config: Config,
+        matcher: _CachedMatcher,
+        streaming_matcher: _Matcher | None,
+    ) -> None:
+        """Create a reader which applies substitutions with ``matcher``."""
+        super().__init__(filename=filename, options=options, config=config)
+        self._matcher = matcher
+        self._streaming_matcher = streaming_matcher
+
+    # The defaults match the overridden methods of ``LiteralIncludeReader``.
+    def read_file(
+        self,
+        filename: str | os.PathLike[str],
+        location: tuple[str, int] | None = None,  # noqa: NOD001
+    ) -> list[str]:
+        """Read the lines of a file and apply substitutions to them."""
+        lines = super().read_file(filename=filename, location=location)
+        text = self._matcher.apply(text="".join(lines))
+        return text.splitlines(keepends=True)
+
+    def read(
+        self,
+        location: tuple[str, int] | None = None,  # noqa: NOD001
+    ) -> tuple[str, int]:
+        """Read the file and get its content and number of lines."""
+        if self._streaming_matcher is None:
+            return super().read(location=location)
+
+        try:
+            return _apply_streaming(
+                path=Path(self.filename),
+                encoding=self.encoding,
+                matcher=self._streaming_matcher,
+            )
+        except UnicodeError as exc:
+            # This is the error which ``read_file`` raises.
+            message = __(
+                "Encoding %r used for reading included file '%s' seems to "
+                "be wrong, try giving an :encoding: option"
+            ) % (self.encoding, self.filename)
+            raise UnicodeError(message) from exc
+
+
+@beartype(conf=_BEARTYPE_CONF)
+class SubstitutionLiteralInclude(LiteralInclude):
+    """
+    Similar to LiteralInclude but replaces placeholders with
+    variables.
+    """
+
+    option_spec: ClassVar[OptionSpec] = (
+        LiteralInclude.option_spec.copy() if LiteralInclude.option_spec else {}
+    )
+    option_spec[CONTENT_SUBSTITUTION_OPTION_NAME] = directives.flag
+    option_spec[PATH_SUBSTITUTION_OPTION_NAME] = directives.flag
+    option_spec[NO_CONTENT_SUBSTITUTION_OPTION_NAME] = directives.flag
+    option_spec[NO_PATH_SUBSTITUTION_OPTION_NAME] = directives.flag
+    option_spec[SUBSTITUTIONS_BEFORE_FILTERS_OPTION_NAME] = directives.flag
+
+    def run(self) -> list[Node]:
+        """
+        Replace placeholders with given variables in the file path
+        and/or
+        included file content.
+        """
+        with _instrumented(env=self.env, component=type(self).__name__):
+            should_apply_path_substitutions = _should_apply_substitutions(
+                options=self.options,
+                env=self.env,
+                yes_flag=PATH_SUBSTITUTION_OPTION_NAME,
+                no_flag=NO_PATH_SUBSTITUTION_OPTION_NAME,
+            )
+            should_apply_content_substitutions = _should_apply_substitutions(
+                options=self.options,
+                env=self.env,
+                yes_flag=CONTENT_SUBSTITUTION_OPTION_NAME,
+                no_flag=NO_CONTENT_SUBSTITUTION_OPTION_NAME,
+            )
+            if not (
+                should_apply_path_substitutions
+                or should_apply_content_substitutions
+            ):
+                return super().run()
+
+            matcher = _get_substitution_context(
+                env=self.env,
+                doctree=self.state.document,
+                myst_config=_get_myst_config(context=self.state),
+            ).matcher
+
+            if should_apply_path_substitutions:
+                for argument_index, argument in enumerate(
+                    iterable=self.arguments
+                ):
+                    self.arguments[argument_index] = matcher.apply(
+                        text=argument
+                    )
+
+            if not should_apply_content_substitutions:
+                return super().run()
+
+            cached_matcher = _get_cached_matcher(env=self.env, matcher=matcher)
+            stream = self._should_stream(matcher=matcher)
+            if (
+                stream
+                or SUBSTITUTIONS_BEFORE_FILTERS_OPTION_NAME in self.options
+            ):
+                # No option selects lines when content is streamed, so
+                # substituting before the filters gives the same content.
+                nodes_list = self._run_with_reader(
+                    matcher=cached_matcher,
+                    streaming_matcher=matcher if stream else None,
+                )
+                _process_nodes(
+                    nodes=[
+                        caption_node
+                        for node in nodes_list
+                        for caption_node in node.findall(condition=caption)
+                    ],
+                    source_path=None,
+                    matcher=matcher,
+                    content_matcher=None,
+                )
+                return nodes_list
+
+            nodes_list = super().run()
+            # Sphinx has already selected the lines to include, so only
+            # those lines are substituted.
+            _process_nodes(
+                nodes=nodes_list,
+                source_path=None,
+                matcher=matcher,
+                content_matcher=cached_matcher,
+            )
+            return nodes_list
+
+    def _should_stream(self, *, matcher: _Matcher) -> bool:
+        """Whether to read and substitute the included file a chunk at a
+        time, rather than reading it whole.
+        """
+        min_bytes: int | None = self.config.substitutions_streaming_min_bytes
+        if (
+            min_bytes is None
+            or matcher.can_match_newline
+            or not self.options.keys().isdisjoint(_LINE_FILTER_OPTIONS)
+        ):
+            return False
+
+        _, filename = self.env.relfn2path(filename=self.arguments[0])
+        try:
+            size = Path(filename).stat().st_size
+        except OSError:
+            # ``literalinclude`` reports the missing file.
+            return False
+        # Empty files cannot be memory-mapped.
+        return size >= max(min_bytes, 1)
+
+    def _run_with_reader(
+        self,
         *,
-        env: BuildEnvironment,
-        substitution_defs: dict[str, str],
-        delimiter_pairs: set[tuple[str, str]],
+        matcher: _CachedMatcher,
+        streaming_matcher: _Matcher | None,
     ) -> list[Node]:
-        """Apply substitutions after existing include-read listeners."""
-        include_read_emitted = False
-        _relative_path, absolute_path = env.relfn2path(
+        """Include a file, replacing placeholders in the whole file before
+        options such as ``:start-after:`` select lines, or as it is
+        streamed.
+
+        ``LiteralInclude.run`` has no way to use another reader, so this
+        and the methods which it calls follow ``LiteralInclude.run`` from
+        Sphinx 9.0 with only the reader changed.  Compare them with
+        ``sphinx/directives/code.py`` when the supported versions of Sphinx
+        change.  A test checks that the nodes match those which
+        ``literalinclude`` makes.
+        """
+        doctree = self.state.document
+        # The type stubs of docutils do not type the keyword arguments of
+        # reporter methods.
+        reporter = doctree.reporter
+        if not doctree.settings.file_insertion_enabled:
+            return [
+                reporter.warning(  # pyright: ignore[reportUnknownMemberType]
+                    "File insertion disabled",
+                    line=self.lineno,
+                ),
+            ]
+        if "diff" in self.options:
+            _, path = self.env.relfn2path(filename=self.options["diff"])
+            self.options["diff"] = path
+
+        # Sphinx catches every exception here.  Reading, filtering and
+        # parsing the options raise these.
+        try:
+            return [
+                self._make_literal_node(
+                    matcher=matcher,
+                    streaming_matcher=streaming_matcher,
+                ),
+            ]
+        except (OSError, ValueError) as exc:
+            return [
+                reporter.warning(  # pyright: ignore[reportUnknownMemberType]
+                    exc,
+                    line=self.lineno,
+                ),
+            ]
+
+    def _make_literal_node(
+        self,
+        *,
+        matcher: _CachedMatcher,
+        streaming_matcher: _Matcher | None,
+    ) -> Element:
+        """Read the included file and make the node which holds it."""
+        location = self.get_source_info()
+        rel_filename, filename = self.env.relfn2path(
             filename=self.arguments[0],
         )
-        current_include_path = Path(absolute_path).resolve()
+        self.env.note_dependency(filename=rel_filename)
+
+        reader = _SubstitutionLiteralIncludeReader(
+            filename=filename,
+            options=self.options,
+            config=self.config,
+            matcher=matcher,
+            streaming_matcher=streaming_matcher,
+        )
+        text, lines = reader.read(location=location)
+
+        retnode: Element = literal_block(text, text, source=filename)
+        retnode["force"] = "force" in self.options
+        self.set_source_info(node=retnode)
+        if self.options.get("diff"):
+            retnode["language"] = "udiff"
+        elif "language" in self.options:
+            retnode["language"] = self.options["language"]
+        if (
+            "linenos" in self.options
+            or "lineno-start" in self.options
+            or "lineno-match" in self.options
+        ):
+            retnode["linenos"] = True
+        retnode["classes"] += self.options.get("class", [])
+        retnode["highlight_args"] = self._get_highlight_args(
+            lines=lines,
+            lineno_start=reader.lineno_start,
+            location=location,
+        )
+
+        if "caption" in self.options:
+            caption_text = self.options["caption"] or self.arguments[0]
+            retnode = container_wrapper(
+                directive=self,
+                literal_node=retnode,
+                caption=caption_text,
+            )
 
-        def substitute_include_content(
-            _app: Sphinx,
-            relative_path: Path,
-            _parent_docname: str,
-            content: list[str],
-        ) -> None:
-            """Substitute content changed by earlier listeners."""
-            included_path = (env.srcdir / relative_path).resolve()
-            if included_path != current_include_path:
-                return
+        self.add_name(node=retnode)
+        return retnode
 
-            nonlocal include_read_emitted
-            include_read_emitted = True
-            content[0] = _apply_substitutions(
-                text=content[0],
-                substitution_defs=substitution_defs,
-                delimiter_pairs=delimiter_pairs,
+    def _get_highlight_args(
+        self,
+        *,
+        lines: int,
+        lineno_start: int,
+        location: tuple[str, int],
+    ) -> dict[str, Any]:
+        """Get the highlighting arguments for the included lines."""
+        extra_args: dict[str, Any] = {}
+        if "emphasize-lines" in self.options:
+            # ``parselinenos`` is the public name of Sphinx's line number
+            # spec parser.
+            hl_lines = sphinx_util.parselinenos(
+                spec=self.options["emphasize-lines"],
+                total=lines,
             )
+            if any(line >= lines for line in hl_lines):
+                _LOGGER.warning(
+                    __("line number spec is out of range(1-%d): %r"),
+                    lines,
+                    self.options["emphasize-lines"],
+                    location=location,
+                )
+            extra_args["hl_lines"] = [
+                line + 1 for line in hl_lines if line < lines
+            ]
+        extra_args["linenostart"] = lineno_start
+        return extra_args
+
+
+@beartype(conf=_BEARTYPE_CONF)
+class SubstitutionInclude(Include):
+    """
+    Similar to Include but replaces placeholders with variables in the
+    path.
+    """
+
+    option_spec: ClassVar[OptionSpec | None] = {
+        **(Include.option_spec or {}),
+        CONTENT_SUBSTITUTION_OPTION_NAME: directives.flag,
+        PATH_SUBSTITUTION_OPTION_NAME: directives.flag,
+        NO_CONTENT_SUBSTITUTION_OPTION_NAME: directives.flag,
+        NO_PATH_SUBSTITUTION_OPTION_NAME: directives.flag,
+    }
 
-        listener_id = env.events.connect(
-            name="include-read",
-            callback=substitute_include_content,
-            priority=999,
+    def _run_with_include_read(
+        self,
+        *,
+        env: BuildEnvironment,
+        matcher: _Matcher,
+    ) -> list[Node]:
+        """Include a file, applying substitutions to its content.
+
+        Included reST is substituted by :func:`_substitute_include_content`
+        when Sphinx emits ``include-read``, after other listeners.  Content
+        which does not emit the event, such as literal includes, is
+        substituted in the nodes which ``Include.run`` returns.
+        """
+        _connect_include_read_listener(events=env.events)
+        cached_matcher = _get_cached_matcher(env=env, matcher=matcher)
+        active_include = _ActiveInclude(
+            matcher=cached_matcher,
+            arguments=self.arguments,
         )
+        active_includes = _get_active_includes(env=env)
+        active_includes.append(active_include)
         try:
             nodes_list = list(super().run())
         finally:
-            env.events.disconnect(listener_id=listener_id)
-
-        if not include_read_emitted:
-            for node in nodes_list:
-                assert isinstance(node, Element)
-                _process_node(
-                    node=node,
-                    source_path=current_include_path,
-                    substitution_defs=substitution_defs,
-                    delimiter_pairs=delimiter_pairs,
-                )
+            active_includes.pop()
+
+        if not active_include.include_read_emitted:
+            # ``Include.run`` replaced the path argument with the resolved
+            # path of the included file.
+            _process_nodes(
+                nodes=nodes_list,
+                source_path=Path(self.arguments[0]),
+                matcher=matcher,
+                content_matcher=cached_matcher,
+            )
 
         return nodes_list
 
@@ -605,99 +2272,48 @@ class SubstitutionInclude(Include):
         if env is None:
             return list(DocutilsInclude.run(self=self))
 
-        config = env.config
-        myst_config = _get_myst_config(context=self.state)
-        should_apply_path_substitutions = _should_apply_substitutions(
-            options=self.options,
-            config=config,
-            yes_flag=PATH_SUBSTITUTION_OPTION_NAME,
-            no_flag=NO_PATH_SUBSTITUTION_OPTION_NAME,
-        )
-        should_apply_content_substitutions = _should_apply_substitutions(
-            options=self.options,
-            config=config,
-            yes_flag=CONTENT_SUBSTITUTION_OPTION_NAME,
-            no_flag=NO_CONTENT_SUBSTITUTION_OPTION_NAME,
-        )
-
-        if not (
-            should_apply_path_substitutions
-            or should_apply_content_substitutions
-        ):
-            return list(super().run())
-
-        substitution_defs = _get_substitution_defs(
-            env=env,
-            config=config,
-            substitution_defs=self.state.document.substitution_defs,
-            myst_config=myst_config,
-        )
-        delimiter_pairs = _get_delimiter_pairs(
-            env=env,
-            config=config,
-            myst_config=myst_config,
-        )
-
-        if should_apply_path_substitutions:
-            for argument_index, argument in enumerate(iterable=self.arguments):
-                self.arguments[argument_index] = _apply_substitutions(
-                    text=argument,
-                    substitution_defs=substitution_defs,
-                    delimiter_pairs=delimiter_pairs,
-                )
-
-        if not should_apply_content_substitutions:
-            return list(super().run())
-
-        if env.events.listeners.get("include-read"):
-            return self._run_with_include_read(
+        with _instrumented(env=env, component=type(self).__name__):
+            myst_config = _get_myst_config(context=self.state)
+            should_apply_path_substitutions = _should_apply_substitutions(
+                options=self.options,
                 env=env,
-                substitution_defs=substitution_defs,
-                delimiter_pairs=delimiter_pairs,
-            )
-
-        original_insert_input = self.state_machine.insert_input
-
-        def insert_substituted_input(
-            input_lines: list[str],
-            source: str,
-        ) -> None:
-            """Insert included lines after applying substitutions."""
-            substituted_lines = [
-                _apply_substitutions(
-                    text=line,
-                    substitution_defs=substitution_defs,
-                    delimiter_pairs=delimiter_pairs,
-                )
-                for line in input_lines
-            ]
-            original_insert_input(
-                input_lines=substituted_lines,
-                source=source,
+                yes_flag=PATH_SUBSTITUTION_OPTION_NAME,
+                no_flag=NO_PATH_SUBSTITUTION_OPTION_NAME,
+            )
+            should_apply_content_substitutions = _should_apply_substitutions(
+                options=self.options,
+                env=env,
+                yes_flag=CONTENT_SUBSTITUTION_OPTION_NAME,
+                no_flag=NO_CONTENT_SUBSTITUTION_OPTION_NAME,
             )
 
-        # ``Include.run`` only queues these lines.  Nested includes are parsed
-        # after it returns, when this patch has already been removed.
-        with patch.object(
-            target=self.state_machine,
-            attribute="insert_input",
-            new=insert_substituted_input,
-        ):
-            nodes_list = list(super().run())
+            if not (
+                should_apply_path_substitutions
+                or should_apply_content_substitutions
+            ):
+                return list(super().run())
 
-        for node in nodes_list:
-            assert isinstance(node, Element)
-            _process_node(
-                node=node,
-                source_path=None,
-                substitution_defs=substitution_defs,
-                delimiter_pairs=delimiter_pairs,
-            )
+            matcher = _get_substitution_context(
+                env=env,
+                doctree=self.state.document,
+                myst_config=myst_config,
+            ).matcher
+
+            if should_apply_path_substitutions:
+                for argument_index, argument in enumerate(
+                    iterable=self.arguments
+                ):
+                    self.arguments[argument_index] = matcher.apply(
+                        text=argument
+                    )
 
-        return nodes_list
+            if not should_apply_content_substitutions:
+                return list(super().run())
 
+            return self._run_with_include_read(env=env, matcher=matcher)
 
-@beartype
+
+@beartype(conf=_BEARTYPE_CONF)
 class SubstitutionImage(Image):
     """
     Similar to Image but replaces placeholders with variables in the
@@ -713,41 +2329,34 @@ class SubstitutionImage(Image):
     def run(self) -> list[Node]:
         """Replace placeholders with given variables in the image path."""
         env = self.state.document.settings.env
-        config = env.config
-        myst_config = _get_myst_config(context=self.state)
-
-        should_apply_path_substitutions = _should_apply_substitutions(
-            options=self.options,
-            config=config,
-            yes_flag=PATH_SUBSTITUTION_OPTION_NAME,
-            no_flag=NO_PATH_SUBSTITUTION_OPTION_NAME,
-        )
-
-        if should_apply_path_substitutions:
-            substitution_defs = _get_substitution_defs(
-                env=env,
-                config=config,
-                substitution_defs=self.state.document.substitution_defs,
-                myst_config=myst_config,
-            )
+        with _instrumented(env=env, component=type(self).__name__):
+            myst_config = _get_myst_config(context=self.state)
 
-            delimiter_pairs = _get_delimiter_pairs(
+            should_apply_path_substitutions = _should_apply_substitutions(
+                options=self.options,
                 env=env,
-                config=config,
-                myst_config=myst_config,
+                yes_flag=PATH_SUBSTITUTION_OPTION_NAME,
+                no_flag=NO_PATH_SUBSTITUTION_OPTION_NAME,
             )
 
-            for argument_index, argument in enumerate(iterable=self.arguments):
-                self.arguments[argument_index] = _apply_substitutions(
-                    text=argument,
-                    substitution_defs=substitution_defs,
-                    delimiter_pairs=delimiter_pairs,
-                )
+            if should_apply_path_substitutions:
+                matcher = _get_substitution_context(
+                    env=env,
+                    doctree=self.state.document,
+                    myst_config=myst_config,
+                ).matcher
+
+                for argument_index, argument in enumerate(
+                    iterable=self.arguments
+                ):
+                    self.arguments[argument_index] = matcher.apply(
+                        text=argument
+                    )
 
-        return list(super().run())
+            return list(super().run())
 
 
-@beartype
+@beartype(conf=_BEARTYPE_CONF)
 class SubstitutionXRefRole(XRefRole):
     """Custom role for XRefs."""
 
@@ -763,6 +2372,13 @@ class SubstitutionXRefRole(XRefRole):
 
         return super().create_xref_node()
 
+    def run(self) -> tuple[list[Node], list[system_message]]:
+        """Record statistics for the role when instrumentation is
+        enabled.
+        """
+        with _instrumented(env=self.env, component=type(self).__name__):
+            return super().run()
+
     def process_link(
         self,
         env: BuildEnvironment,
@@ -779,29 +2395,14 @@ class SubstitutionXRefRole(XRefRole):
         """
         assert isinstance(env, BuildEnvironment)
         myst_config = _get_myst_config(context=self.inliner)
-        substitution_defs = _get_substitution_defs(
-            env=env,
-            config=env.config,
-            substitution_defs=self.inliner.document.substitution_defs,
-            myst_config=myst_config,
-        )
-
-        delimiter_pairs = _get_delimiter_pairs(
+        matcher = _get_substitution_context(
             env=env,
-            config=env.config,
+            doctree=self.inliner.document,
             myst_config=myst_config,
-        )
+        ).matcher
 
-        title = _apply_substitutions(
-            text=title,
-            substitution_defs=substitution_defs,
-            delimiter_pairs=delimiter_pairs,
-        )
-        target = _apply_substitutions(
-            text=target,
-            substitution_defs=substitution_defs,
-            delimiter_pairs=delimiter_pairs,
-        )
+        title = matcher.apply(text=title)
+        target = matcher.apply(text=target)
 
         # Use the default implementation to process the link
         # as it handles whitespace in target text.
@@ -814,19 +2415,528 @@ class SubstitutionXRefRole(XRefRole):
         )
 
 
-@beartype
+# The role which ``substitution-code`` roles are rewritten to when
+# substitutions are applied to the source.  Its text has already been
+# substituted.  It is only registered when substitutions are applied to the
+# source.
+_SUBSTITUTED_CODE_ROLE_NAME = "substituted-code"
+
+# A substitution definition in ``rst_prolog`` which can be applied to raw
+# source.
+_PROLOG_DEFINITION_PATTERN = re.compile(
+    pattern=(
+        r"\.\. \|(?P<name>[^|\s](?:[^|]*[^|\s])?)\| replace:: (?P<value>.+)"
+    ),
+)
+
+# Replacement text which would be parsed as anything other than plain text,
+# such as inline markup, escapes, references or lists, or which has
+# whitespace other than single spaces.  The text of these definitions
+# differs from their source.  Other replacement text can be put in a line of
+# source without changing how the rest of the line is parsed.
+_NON_PLAIN_TEXT_PATTERN = re.compile(
+    pattern=r"[*`|\\]|::|_(?!\w)|\s\s|[^\S ]|^(?:\W|\w+[.)]\s)",
+)
+
+# A substitution definition in a document.  Definitions in a document change
+# the substitution table part way through the document.
+_SOURCE_DEFINITION_PATTERN = re.compile(
+    pattern=r"^\s*\.\.\s+\|",
+    flags=re.MULTILINE,
+)
+
+# The start of a comment, directive or other explicit markup.
+_EXPLICIT_MARKUP_PATTERN = re.compile(pattern=r"\s*\.\.(?:\s|$)")
+
+# A directive, with the part of its arguments which is on the same line.
+_DIRECTIVE_PATTERN = re.compile(
+    pattern=r"\s*\.\. +(?P<name>[\w:+._-]+?) ?::(?: +|$)(?P<argument>.*?)\s*$",
+)
+
+# A section title adornment, transition or simple table border.  Text near
+# these is not rewritten, because a change in its length changes how it is
+# parsed.
+_ADORNMENT_PATTERN = re.compile(
+    pattern=r"\s*(?:([!-/:-@\[-`{-~])\1*|=+(?: +=+)*)\s*$",
+)
+
+# The top or bottom border of a simple table.  Rows of a simple table can be
+# separated by blank lines.
+_SIMPLE_TABLE_BORDER_PATTERN = re.compile(pattern=r"\s*=+(?: +=+)*\s*$")
+
+# The start of a doctest block, which is shown as it is written.
+_DOCTEST_BLOCK_PATTERN = re.compile(pattern=r"\s*>>>(?:\s|$)")
+
+# Inline markup which could contain a role, in which case the role is text.
+_ENCLOSING_MARKUP_PATTERN = re.compile(
+    pattern=r"``|_`|(?<![^\s'\"(\[{<\-/:])\*+[^\s*]",
+)
+
+# A ``substitution-code`` role with text on one line, which docutils would
+# recognize as inline markup.
+_SOURCE_ROLE_PATTERN = re.compile(
+    pattern=(
+        r"(?<![^\s'\"(\[{<\-/:]):substitution-code:"
+        r"`(?P<text>[^`\\\s](?:[^`\\]*[^`\\\s])?)`"
+        r"(?![^\s'\")\]}>\-/:.,;!?])"
+    ),
+)
+
+# Directives whose content is parsed as reST, so it is scanned for other
+# directives and roles.  The content of other directives is skipped.
+_SOURCE_NESTED_DIRECTIVES = frozenset(
+    {
+        "admonition",
+        "attention",
+        "caution",
+        "container",
+        "danger",
+        "deprecated",
+        "error",
+        "hint",
+        "important",
+        "note",
+        "only",
+        "seealso",
+        "sidebar",
+        "tip",
+        "topic",
+        "versionadded",
+        "versionchanged",
+        "versionremoved",
+        "warning",
+    },
+)
+
+# Directives which can be substituted in the source, with the flags which
+# enable and disable their substitutions there.  Only the body of
+# ``code-block`` and the path of the others are substituted.
+_SOURCE_DIRECTIVE_FLAGS = {
+    "code-block": (SUBSTITUTION_OPTION_NAME, NO_SUBSTITUTION_OPTION_NAME),
+    "image": (PATH_SUBSTITUTION_OPTION_NAME, NO_PATH_SUBSTITUTION_OPTION_NAME),
+    "include": (
+        PATH_SUBSTITUTION_OPTION_NAME,
+        NO_PATH_SUBSTITUTION_OPTION_NAME,
+    ),
+    "literalinclude": (
+        PATH_SUBSTITUTION_OPTION_NAME,
+        NO_PATH_SUBSTITUTION_OPTION_NAME,
+    ),
+}
+
+# Substitution definitions in ``rst_prolog`` which can be applied to the raw
+# source of reST documents, computed once at ``config-inited``.  No table is
+# stored when the prolog contains anything else.
+_PROLOG_SUBSTITUTIONS: WeakKeyDictionary[Config, dict[str, str]] = (
+    WeakKeyDictionary()
+)
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _parse_prolog_substitutions(app: Sphinx, config: Config) -> None:
+    """Get the plain text substitution definitions in ``rst_prolog``, and
+    register the role which substituted roles are rewritten to.
+
+    Definitions are only taken from a prolog which contains nothing but
+    ``replace`` definitions of plain text, as other content could change
+    the table which directives see.
+    """
+    if not config.substitutions_source_read_enabled:
+        return
+
+    substitution_defs: dict[str, str] = {}
+    for line in (config.rst_prolog or "").splitlines():
+        if not line.strip():
+            continue
+        match = _PROLOG_DEFINITION_PATTERN.fullmatch(string=line.rstrip())
+        if (
+            match is None
+            or match["name"] in substitution_defs
+            or _NON_PLAIN_TEXT_PATTERN.search(string=match["value"])
+        ):
+            return
+        substitution_defs[match["name"]] = match["value"]
+
+    _PROLOG_SUBSTITUTIONS[config] = substitution_defs
+    app.add_role(name=_SUBSTITUTED_CODE_ROLE_NAME, role=code_role)
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _indentation(*, line: str) -> int:
+    """Get the indentation of a line as docutils measures it."""
+    if "\t" in line:
+        line = line.expandtabs(tabsize=8)
+    return len(line) - len(line.lstrip())
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _block_end(*, lines: list[str], start: int, indentation: int) -> int:
+    """Get the index of the first line from ``start`` which is not blank
+    and not indented more than ``indentation``.
+    """
+    index = start
+    while index < len(lines) and (
+        not lines[index].strip()
+        or _indentation(line=lines[index]) > indentation
+    ):
+        index += 1
+    return index
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _get_source_flag_index(
+    *,
+    lines: list[str],
+    start: int,
+    options_end: int,
+    yes_flag: str,
+    no_flag: str,
+) -> int | None:
+    """Get the index of the line with a directive's flag which enables
+    substitutions.
+
+    ``None`` is returned if there is no such flag, if the directive has the
+    flag which disables substitutions, or if its arguments or options span
+    more than one line.
+    """
+    flag_index = None
+    for index in range(start + 1, options_end):
+        option = lines[index].strip()
+        if not option.startswith(":") or option.startswith(f":{no_flag}:"):
+            return None
+        if option == f":{yes_flag}:":
+            flag_index = index
+    return flag_index
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _substitute_code_block_source(
+    *,
+    lines: list[str],
+    content_start: int,
+    end: int,
+    matcher: _SubstitutionMatcher,
+) -> dict[int, str] | None:
+    """Get the substituted lines of a ``code-block`` body by index.
+
+    ``None`` is returned if the body has tabs.
+    """
+    substituted_lines: dict[int, str] = {}
+    for index in range(content_start, end):
+        line = lines[index]
+        # Tabs are expanded before the directive gets its content, and a
+        # substitution before a tab would change how it is expanded.
+        if "\t" in line:
+            return None
+        substituted = matcher.apply(text=line)
+        if substituted != line:
+            substituted_lines[index] = substituted
+    return substituted_lines
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _substitute_directive_source(
+    *,
+    lines: list[str],
+    start: int,
+    end: int,
+    directive_match: re.Match[str],
+    matcher: _SubstitutionMatcher,
+) -> None:
+    """Apply substitutions to a ``code-block`` body or to the path of a
+    directive, and replace its flag with the flag which disables
+    substitutions, so that they are not applied again.
+
+    The directive is left unchanged unless it has the flag which enables
+    substitutions, its arguments and options are on one line each, and a
+    ``code-block`` body has no tabs.
+    """
+    name = directive_match["name"]
+    yes_flag, no_flag = _SOURCE_DIRECTIVE_FLAGS[name]
+    options_end = start + 1
+    while options_end < end and lines[options_end].strip():
+        options_end += 1
+    flag_index = _get_source_flag_index(
+        lines=lines,
+        start=start,
+        options_end=options_end,
+        yes_flag=yes_flag,
+        no_flag=no_flag,
+    )
+    if flag_index is None:
+        return
+
+    substituted_lines: dict[int, str] | None
+    if name == "code-block":
+        substituted_lines = _substitute_code_block_source(
+            lines=lines,
+            content_start=options_end,
+            end=end,
+            matcher=matcher,
+        )
+        if substituted_lines is None:
+            return
+    else:
+        line = lines[start]
+        argument = matcher.apply(text=directive_match["argument"])
+        substituted_lines = {
+            start: (
+                line[: directive_match.start("argument")]
+                + argument
+                + line[directive_match.end("argument") :]
+            ),
+        }
+
+    substituted_lines[flag_index] = lines[flag_index].replace(
+        f":{yes_flag}:",
+        f":{no_flag}:",
+        1,
+    )
+    for index, line in substituted_lines.items():
+        lines[index] = line
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _substitute_paragraph_source(
+    *,
+    lines: list[str],
+    start: int,
+    end: int,
+    matcher: _SubstitutionMatcher,
+) -> None:
+    """Apply substitutions to the ``substitution-code`` roles in a
+    paragraph, unless it is a title, a table, a line block or a doctest
+    block, or has inline markup which could contain a role.
+    """
+    if _DOCTEST_BLOCK_PATTERN.match(string=lines[start]):
+        return
+
+    for line in lines[start:end]:
+        if (
+            line.lstrip()[0] in "+|"
+            or _ADORNMENT_PATTERN.match(string=line)
+            or _ENCLOSING_MARKUP_PATTERN.search(string=line)
+        ):
+            return
+
+    for index in range(start, end):
+        lines[index] = _SOURCE_ROLE_PATTERN.sub(
+            repl=lambda match: (
+                f":{_SUBSTITUTED_CODE_ROLE_NAME}:"
+                f"`{matcher.apply(text=match['text'])}`"
+            ),
+            string=lines[index],
+        )
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _literal_block_end(
+    *,
+    lines: list[str],
+    start: int,
+    indentation: int,
+) -> int:
+    """Get the index of the line after a literal block which follows a
+    paragraph ending in ``::``.
+
+    The literal block is either indented or quoted.
+    """
+    index = start
+    while index < len(lines) and not lines[index].strip():
+        index += 1
+    if index < len(lines) and _indentation(line=lines[index]) > indentation:
+        return _block_end(lines=lines, start=index, indentation=indentation)
+    while index < len(lines) and lines[index].strip():
+        index += 1
+    return index
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _substitute_explicit_markup_source(
+    *,
+    lines: list[str],
+    start: int,
+    indentation: int,
+    matcher: _SubstitutionMatcher,
+) -> int | None:
+    """Apply substitutions to a directive, and get the index of the next
+    line to scan.
+
+    ``None`` is returned after an ``include`` directive, as the included
+    file can define substitutions which later lines use.
+    """
+    block_end = _block_end(
+        lines=lines,
+        start=start + 1,
+        indentation=indentation,
+    )
+    directive_match = _DIRECTIVE_PATTERN.match(string=lines[start])
+    name = None if directive_match is None else directive_match["name"]
+    if directive_match is not None and name in _SOURCE_DIRECTIVE_FLAGS:
+        _substitute_directive_source(
+            lines=lines,
+            start=start,
+            end=block_end,
+            directive_match=directive_match,
+            matcher=matcher,
+        )
+    if name == "include":
+        return None
+    if name not in _SOURCE_NESTED_DIRECTIVES:
+        return block_end
+
+    # Skip the arguments and options, and scan the content.
+    index = start + 1
+    while index < block_end and lines[index].strip():
+        index += 1
+    return index
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _substitute_source(*, source: str, matcher: _SubstitutionMatcher) -> str:
+    """Apply substitutions to the directives and roles in reST source.
+
+    The source is scanned once, line by line.  Literal blocks, doctest
+    blocks, comments and the content of directives other than admonitions
+    and similar are skipped, as are titles, tables and text with inline
+    markup which could contain a role.  Nothing after an ``include``
+    directive is changed, as included files can define substitutions.
+    Anything which is not changed is substituted by the directive or role as
+    usual.
+
+    Lines are never added or removed, so line numbers in warnings are
+    unchanged.
+    """
+    lines = source.splitlines(keepends=True)
+    in_simple_table = False
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+        if not line.strip():
+            index += 1
+            continue
+
+        indentation = _indentation(line=line)
+        if _EXPLICIT_MARKUP_PATTERN.match(string=line):
+            next_index = _substitute_explicit_markup_source(
+                lines=lines,
+                start=index,
+                indentation=indentation,
+                matcher=matcher,
+            )
+            if next_index is None:
+                break
+            index = next_index
+            continue
+
+        paragraph_end = index + 1
+        while (
+            paragraph_end < len(lines)
+            and lines[paragraph_end].strip()
+            and not _EXPLICIT_MARKUP_PATTERN.match(string=lines[paragraph_end])
+        ):
+            paragraph_end += 1
+        if _SIMPLE_TABLE_BORDER_PATTERN.match(string=line):
+            in_simple_table = True
+        if not in_simple_table:
+            _substitute_paragraph_source(
+                lines=lines,
+                start=index,
+                end=paragraph_end,
+                matcher=matcher,
+            )
+        if _SIMPLE_TABLE_BORDER_PATTERN.match(string=lines[paragraph_end - 1]):
+            in_simple_table = False
+
+        index = paragraph_end
+        if lines[paragraph_end - 1].rstrip().endswith("::"):
+            index = _literal_block_end(
+                lines=lines,
+                start=index,
+                indentation=indentation,
+            )
+
+    return "".join(lines)
+
+
+@beartype(conf=_BEARTYPE_CONF)
+def _substitute_source_read(
+    app: Sphinx,
+    _docname: str,
+    source: list[str],
+) -> None:
+    """Apply substitutions to the directives and roles in a reST document
+    before it is parsed.
+
+    Only documents which are parsed as reST and do not define their own
+    substitutions are changed.
+    """
+    if not isinstance(
+        app.env.parser, RSTParser
+    ) or _SOURCE_DEFINITION_PATTERN.search(string=source[0]):
+        return
+
+    _note_config_dependency(
+        env=app.env,
+        name="substitutions_source_read_enabled",
+    )
+    substitution_defs = _PROLOG_SUBSTITUTIONS.get(key=app.config)
+    if substitution_defs is None:
+        return
+
+    with _instrumented(env=app.env, component="source-read"):
+        matcher = _SubstitutionMatcher(
+            substitution_defs=substitution_defs,
+            delimiter_pairs={("|", "|")},
+            statistics=_get_document_statistics(env=app.env),
+        )
+        source[0] = _substitute_source(source=source[0], matcher=matcher)
+
+
+@beartype(conf=_BEARTYPE_CONF)
 def setup(app: Sphinx) -> ExtensionMetadata:
     """Add the custom directives to Sphinx."""
     app.add_config_value(name="substitutions", default=[], rebuild="html")
     app.add_config_value(
         name="substitutions_hyperlink_targets_enabled",
         default=False,
-        rebuild="html",
+        rebuild="",
     )
     app.add_config_value(
         name="substitutions_default_enabled",
         default=False,
-        rebuild="html",
+        rebuild="",
+    )
+    app.add_config_value(
+        name="substitutions_lazy_resolution_enabled",
+        default=False,
+        rebuild="",
+    )
+    app.add_config_value(
+        name="substitutions_disk_cache_enabled",
+        default=False,
+        rebuild="",
+    )
+    app.add_config_value(
+        name="substitutions_disk_cache_max_bytes",
+        default=100 * 1024 * 1024,
+        rebuild="",
+    )
+    app.add_config_value(
+        name="substitutions_streaming_min_bytes",
+        default=None,
+        rebuild="",
+        types=frozenset({int, type(None)}),
+    )
+    app.add_config_value(
+        name="substitutions_source_read_enabled",
+        default=False,
+        rebuild="",
+    )
+    app.add_config_value(
+        name="substitutions_instrumentation_enabled",
+        default=False,
+        rebuild="env",
     )
     directives.register_directive(
         name="code-block",
@@ -849,11 +2959,32 @@ def setup(app: Sphinx) -> ExtensionMetadata:
         nodeclass=addnodes.download_reference,
     )
     app.add_role(name="substitution-download", role=substitution_download_role)
+    app.connect(
+        event="config-inited",
+        callback=_flatten_myst_substitutions,
+    )
+    app.connect(
+        event="config-inited",
+        callback=_parse_prolog_substitutions,
+    )
+    app.connect(event="source-read", callback=_substitute_source_read)
     app.connect(
         event="doctree-read",
         callback=_substitute_hyperlink_targets,
     )
+    app.connect(event="env-purge-doc", callback=_purge_statistics)
+    app.connect(event="env-merge-info", callback=_merge_statistics)
+    app.connect(event="env-purge-doc", callback=_purge_config_dependencies)
+    app.connect(event="env-merge-info", callback=_merge_config_dependencies)
+    app.connect(
+        event="env-get-outdated",
+        callback=_get_config_outdated_documents,
+    )
+    app.connect(event="build-finished", callback=_log_scan_counts)
+    app.connect(event="build-finished", callback=_write_statistics)
+    app.connect(event="build-finished", callback=_evict_disk_cache)
     return {
         "parallel_read_safe": True,
+        "parallel_write_safe": True,
         "version": version(distribution_name="sphinx-substitution-extensions"),
     }
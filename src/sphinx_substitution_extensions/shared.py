@@ -10,3 +10,11 @@ PATH_SUBSTITUTION_OPTION_NAME = "path-substitutions"
 NO_SUBSTITUTION_OPTION_NAME = "nosubstitutions"
 NO_CONTENT_SUBSTITUTION_OPTION_NAME = "nocontent-substitutions"
 NO_PATH_SUBSTITUTION_OPTION_NAME = "nopath-substitutions"
+SUBSTITUTIONS_BEFORE_FILTERS_OPTION_NAME = "substitutions-before-filters"
+
+# Set this environment variable to ``1`` to skip runtime type checks, for
+# example in large production builds. Running Python with ``-O`` also skips
+# runtime type checks.
+SKIP_TYPE_CHECKS_ENVIRONMENT_VARIABLE = (
+    "SPHINX_SUBSTITUTION_EXTENSIONS_SKIP_TYPE_CHECKS"
+)
@@ -1,6 +1,12 @@
 """Tests for Sphinx extensions."""
 
+import json
+import os
+import shutil
+import subprocess
+import sys
 from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
 from importlib.metadata import version
 from pathlib import Path
 from textwrap import dedent
@@ -9,10 +15,15 @@ import pytest
 from docutils import core, nodes
 from docutils.parsers.rst import directives
 from sphinx.application import Sphinx
+from sphinx.directives.code import LiteralIncludeReader
 from sphinx.errors import SphinxError
 from sphinx.testing.util import SphinxTestApp
+from sphinx.util.docutils import is_role_registered
 
 import sphinx_substitution_extensions
+from sphinx_substitution_extensions.shared import (
+    SKIP_TYPE_CHECKS_ENVIRONMENT_VARIABLE,
+)
 
 
 def test_setup(
@@ -32,6 +43,7 @@ def test_setup(
     pkg_version = version(distribution_name="sphinx-substitution-extensions")
     assert setup_result == {
         "parallel_read_safe": True,
+        "parallel_write_safe": True,
         "version": pkg_version,
     }
 
@@ -151,7 +163,8 @@ class TestMyst:
         tmp_path: Path,
         make_app: Callable[..., SphinxTestApp],
     ) -> None:
-        """MyST substitution keys containing dots raise SphinxError.
+        """MyST substitution keys containing dots raise SphinxError when
+        the configuration is initialized.
 
         Dots are reserved for nested access notation.
         """
@@ -181,26 +194,57 @@ class TestMyst:
         index_source_file.write_text(data=index_source_file_content)
         markdown_source_file.write_text(data=markdown_source_file_content)
 
-        app = make_app(
-            srcdir=source_directory,
-            exception_on_warning=True,
-            confoverrides={
-                "extensions": [
-                    "myst_parser",
-                    "sphinx_substitution_extensions",
-                ],
-                "myst_enable_extensions": ["substitution"],
-                "myst_substitutions": {
-                    "key.with.dots": "value",
+        with pytest.raises(
+            expected_exception=SphinxError,
+            match=r"Substitution key 'key\.with\.dots' contains a dot",
+        ):
+            make_app(
+                srcdir=source_directory,
+                exception_on_warning=True,
+                confoverrides={
+                    "extensions": [
+                        "myst_parser",
+                        "sphinx_substitution_extensions",
+                    ],
+                    "myst_enable_extensions": ["substitution"],
+                    "myst_substitutions": {
+                        "key.with.dots": "value",
+                    },
                 },
-            },
-        )
+            )
+
+    @staticmethod
+    def test_myst_lazy_substitution_key_with_dot_raises_error(
+        *,
+        tmp_path: Path,
+        make_app: Callable[..., SphinxTestApp],
+    ) -> None:
+        """Top-level MyST substitution keys containing dots raise
+        SphinxError with lazy resolution.
+        """
+        source_directory = tmp_path / "source"
+        source_directory.mkdir()
+        (source_directory / "conf.py").touch()
 
         with pytest.raises(
             expected_exception=SphinxError,
             match=r"Substitution key 'key\.with\.dots' contains a dot",
         ):
-            app.build()
+            make_app(
+                srcdir=source_directory,
+                exception_on_warning=True,
+                confoverrides={
+                    "extensions": [
+                        "myst_parser",
+                        "sphinx_substitution_extensions",
+                    ],
+                    "myst_enable_extensions": ["substitution"],
+                    "myst_substitutions": {
+                        "key.with.dots": "value",
+                    },
+                    "substitutions_lazy_resolution_enabled": True,
+                },
+            )
 
     @staticmethod
     def test_myst_nested_substitution_key_with_dot_raises_error(
@@ -208,7 +252,8 @@ class TestMyst:
         tmp_path: Path,
         make_app: Callable[..., SphinxTestApp],
     ) -> None:
-        """MyST nested substitution keys containing dots raise SphinxError.
+        """MyST nested substitution keys containing dots raise SphinxError
+        when the configuration is initialized.
 
         Dots are reserved for nested access notation.
         """
@@ -238,28 +283,26 @@ class TestMyst:
         index_source_file.write_text(data=index_source_file_content)
         markdown_source_file.write_text(data=markdown_source_file_content)
 
-        app = make_app(
-            srcdir=source_directory,
-            exception_on_warning=True,
-            confoverrides={
-                "extensions": [
-                    "myst_parser",
-                    "sphinx_substitution_extensions",
-                ],
-                "myst_enable_extensions": ["substitution"],
-                "myst_substitutions": {
-                    "parent": {
-                        "key.with.dots": "value",
-                    },
-                },
-            },
-        )
-
         with pytest.raises(
             expected_exception=SphinxError,
             match=r"Substitution key 'key\.with\.dots' contains a dot",
         ):
-            app.build()
+            make_app(
+                srcdir=source_directory,
+                exception_on_warning=True,
+                confoverrides={
+                    "extensions": [
+                        "myst_parser",
+                        "sphinx_substitution_extensions",
+                    ],
+                    "myst_enable_extensions": ["substitution"],
+                    "myst_substitutions": {
+                        "parent": {
+                            "key.with.dots": "value",
+                        },
+                    },
+                },
+            )
 
 
 def test_no_substitution_include(
@@ -424,6 +467,47 @@ def test_include_read_event_with_content_substitutions(
     assert content_html == expected_content_html
 
 
+@pytest.mark.parametrize(
+    argnames="content_substitutions",
+    argvalues=[True, False],
+)
+def test_include_read_listener_is_connected_when_needed(
+    *,
+    tmp_path: Path,
+    make_app: Callable[..., SphinxTestApp],
+    content_substitutions: bool,
+) -> None:
+    """The include-read listener is only connected once an include
+    applies content substitutions, so that Sphinx does not emit the event
+    for includes in other projects.
+    """
+    source_directory = tmp_path / "source"
+    source_directory.mkdir()
+    (source_directory / "conf.py").touch()
+    (source_directory / "example.txt").write_text(data="Included |a|.\n")
+    option = "   :content-substitutions:\n" if content_substitutions else ""
+    (source_directory / "index.rst").write_text(
+        data=f".. include:: example.txt\n{option}\n.. include:: example.txt\n",
+    )
+
+    app = make_app(
+        srcdir=source_directory,
+        exception_on_warning=True,
+        confoverrides={
+            "extensions": ["sphinx_substitution_extensions"],
+            "rst_prolog": ".. |a| replace:: example\n",
+        },
+    )
+    app.build()
+
+    assert app.statuscode == 0
+    listeners = app.events.listeners.get("include-read", [])
+    assert len(listeners) == int(content_substitutions)
+    html = (app.outdir / "index.html").read_text()
+    assert "Included example." in html
+    assert "|a|" not in html
+
+
 def test_default_substitution_include_path(
     *,
     tmp_path: Path,
@@ -507,3 +591,1375 @@ def test_default_substitution_include_disabled(
 
     assert app.statuscode == 0
     assert "Included content" in (app.outdir / "document.html").read_text()
+
+
+def test_config_change_reads_dependent_documents(
+    *,
+    tmp_path: Path,
+    make_app: Callable[..., SphinxTestApp],
+) -> None:
+    """Changing a configuration value reads only the documents which
+    depend on it again.
+    """
+    source_directory = tmp_path / "source"
+    source_directory.mkdir()
+    (source_directory / "conf.py").touch()
+    (source_directory / "index.rst").write_text(
+        data=dedent(
+            text="""\
+            .. toctree::
+
+               code
+               plain
+            """,
+        ),
+    )
+    (source_directory / "code.rst").write_text(
+        data=dedent(
+            text="""\
+            Code
+            ====
+
+            .. |a| replace:: example
+
+            .. code-block:: shell
+
+               $ echo |a|
+            """,
+        ),
+    )
+    (source_directory / "plain.rst").write_text(data="Plain\n=====\n")
+    confoverrides = {"extensions": ["sphinx_substitution_extensions"]}
+
+    app = make_app(
+        srcdir=source_directory,
+        exception_on_warning=True,
+        confoverrides=confoverrides,
+    )
+    app.build()
+    assert app.statuscode == 0
+    assert "example" not in (app.outdir / "code.html").read_text()
+    app.cleanup()
+
+    app_enabled = make_app(
+        srcdir=source_directory,
+        exception_on_warning=True,
+        confoverrides={
+            **confoverrides,
+            "substitutions_default_enabled": True,
+        },
+    )
+    read_docnames: list[str] = []
+
+    def on_env_before_read_docs(
+        _app: Sphinx,
+        _env: object,
+        docnames: list[str],
+    ) -> None:
+        """Record the documents which will be read."""
+        read_docnames.extend(docnames)
+
+    app_enabled.connect(
+        event="env-before-read-docs",
+        callback=on_env_before_read_docs,
+    )
+    app_enabled.build()
+
+    assert app_enabled.statuscode == 0
+    assert read_docnames == ["code"]
+    assert "example" in (app_enabled.outdir / "code.html").read_text()
+
+
+def _build_and_read_output(
+    *,
+    app: SphinxTestApp,
+    pattern: str,
+) -> dict[Path, bytes]:
+    """Build a project and get the content of each output file which
+    matches ``pattern``, by path relative to the output directory.
+
+    The application is cleaned up afterwards, so that another one can be
+    created.
+    """
+    app.build()
+    assert app.statuscode == 0
+    outdir = Path(app.outdir)
+    output = {
+        path.relative_to(outdir): path.read_bytes()
+        for path in outdir.rglob(pattern=pattern)
+        if path.is_file()
+    }
+    app.cleanup()
+    return output
+
+
+def test_parallel_build_matches_serial_build(
+    *,
+    tmp_path: Path,
+    make_app: Callable[..., SphinxTestApp],
+) -> None:
+    """Building the sample project with four processes gives the same
+    output as a serial build.
+    """
+    sample_source_directory = (
+        Path(__file__).parent.parent / "sample" / "source"
+    )
+    serial_source_directory = tmp_path / "source-serial"
+    parallel_source_directory = tmp_path / "source-parallel"
+    for source_directory in (
+        serial_source_directory,
+        parallel_source_directory,
+    ):
+        shutil.copytree(src=sample_source_directory, dst=source_directory)
+
+    serial_output = _build_and_read_output(
+        app=make_app(srcdir=serial_source_directory, parallel=0),
+        pattern="*",
+    )
+    parallel_output = _build_and_read_output(
+        app=make_app(srcdir=parallel_source_directory, parallel=4),
+        pattern="*",
+    )
+
+    assert parallel_output.keys() == serial_output.keys()
+    for path, content in serial_output.items():
+        assert parallel_output[path] == content, path
+
+
+def test_threaded_builds_match_serial_build(
+    *,
+    tmp_path: Path,
+    make_app: Callable[..., SphinxTestApp],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Building copies of the sample project in a thread pool gives the
+    same output as a serial build.
+
+    The builds share the process's caches.  With a small content cache,
+    included content is evicted while other threads read it.
+    """
+    monkeypatch.setattr(
+        target=sphinx_substitution_extensions,
+        name="_CONTENT_CACHE_MAX_CHARACTERS",
+        value=64,
+    )
+    sample_source_directory = (
+        Path(__file__).parent.parent / "sample" / "source"
+    )
+    confoverrides = {
+        "substitutions_hyperlink_targets_enabled": True,
+        "substitutions_source_read_enabled": True,
+    }
+    # Sphinx registers directives and roles with docutils for the whole
+    # process when an application is created, so applications are created
+    # and cleaned up one at a time, and only their builds are concurrent.
+    apps: list[SphinxTestApp] = []
+    for index in range(5):
+        source_directory = tmp_path / f"source-{index}"
+        shutil.copytree(src=sample_source_directory, dst=source_directory)
+        apps.append(
+            make_app(srcdir=source_directory, confoverrides=confoverrides),
+        )
+
+    serial_app, *threaded_apps = apps
+    serial_app.build()
+    with ThreadPoolExecutor(max_workers=len(threaded_apps)) as executor:
+        for future in [executor.submit(app.build) for app in threaded_apps]:
+            future.result()
+
+    outputs: list[dict[Path, bytes]] = []
+    for app in apps:
+        assert app.statuscode == 0
+        outdir = Path(app.outdir)
+        outputs.append(
+            {
+                path.relative_to(outdir): path.read_bytes()
+                for path in outdir.rglob(pattern="*.html")
+            },
+        )
+        app.cleanup()
+
+    serial_output, *threaded_outputs = outputs
+    for threaded_output in threaded_outputs:
+        assert threaded_output == serial_output
+
+
+def test_scan_counts_are_logged(
+    *,
+    tmp_path: Path,
+    make_app: Callable[..., SphinxTestApp],
+) -> None:
+    """Report how many texts were skipped without a placeholder scan,
+    including texts from parallel read workers.
+    """
+    source_directory = tmp_path / "source"
+    source_directory.mkdir()
+    (source_directory / "conf.py").touch()
+    docnames = [f"document_{index}" for index in range(6)]
+    toctree_entries = "".join(f"   {docname}\n" for docname in docnames)
+    (source_directory / "index.rst").write_text(
+        data=f".. toctree::\n\n{toctree_entries}",
+    )
+    for docname in docnames:
+        (source_directory / f"{docname}.rst").write_text(
+            data=dedent(
+                text="""\
+                Title
+                =====
+
+                .. |a| replace:: example
+
+                .. code-block:: shell
+                   :substitutions:
+
+                   $ echo |a|
+                   $ echo plain
+                """,
+            ),
+        )
+
+    app = make_app(
+        srcdir=source_directory,
+        exception_on_warning=True,
+        confoverrides={"extensions": ["sphinx_substitution_extensions"]},
+        parallel=2,
+        verbosity=1,
+    )
+    app.build()
+
+    assert app.statuscode == 0
+    expected_message = "Substitution pre-scan skipped 6 of 12 texts (50.0%)"
+    assert expected_message in app.status.getvalue()
+
+
+def test_instrumentation_statistics_are_written(
+    *,
+    tmp_path: Path,
+    make_app: Callable[..., SphinxTestApp],
+) -> None:
+    """With instrumentation enabled, statistics for each directive, role
+    and pass are written to the output directory.
+    """
+    source_directory = tmp_path / "source"
+    source_directory.mkdir()
+    (source_directory / "conf.py").touch()
+    docnames = [f"document_{index}" for index in range(6)]
+    toctree_entries = "".join(f"   {docname}\n" for docname in docnames)
+    (source_directory / "index.rst").write_text(
+        data=f".. toctree::\n\n{toctree_entries}",
+    )
+    for docname in docnames:
+        (source_directory / f"{docname}.rst").write_text(
+            data=dedent(
+                text="""\
+                Title
+                =====
+
+                .. |a| replace:: example
+
+                .. code-block:: shell
+                   :substitutions:
+
+                   $ echo |a|
+
+                Run :substitution-code:`echo |a| |a|`.
+
+                See the `example`_.
+
+                .. _example: https://example.com/|a|
+                """,
+            ),
+        )
+
+    app = make_app(
+        srcdir=source_directory,
+        exception_on_warning=True,
+        confoverrides={
+            "extensions": ["sphinx_substitution_extensions"],
+            "substitutions_hyperlink_targets_enabled": True,
+            "substitutions_instrumentation_enabled": True,
+        },
+    )
+    app.build()
+
+    assert app.statuscode == 0
+    statistics_path = Path(app.outdir) / "substitution-statistics.json"
+    statistics = json.loads(s=statistics_path.read_text())
+    assert set(statistics["documents"]) == {"index", *docnames}
+    components = statistics["total"]["components"]
+    assert set(components) == {
+        "SubstitutionCodeBlock",
+        "SubstitutionCodeRole",
+        "hyperlink-targets",
+    }
+    code_block_statistics = components["SubstitutionCodeBlock"]
+    assert code_block_statistics["calls"] == len(docnames)
+    assert code_block_statistics["placeholders"] == len(docnames)
+    assert code_block_statistics["rewritten_characters"] == len(
+        "$ echo example",
+    ) * len(docnames)
+    assert (
+        0
+        <= code_block_statistics["max_seconds"]
+        <= code_block_statistics["total_seconds"]
+    )
+    code_role_statistics = components["SubstitutionCodeRole"]
+    # Placeholders are replaced in both the role's text and its raw text.
+    assert code_role_statistics["placeholders"] == 4 * len(docnames)
+    assert components["hyperlink-targets"]["calls"] == len(docnames) + 1
+
+
+@pytest.mark.parametrize(
+    argnames=("cached_contents", "expected_misses", "expected_hits"),
+    argvalues=[
+        # The literal block's raw source and text are the same content, so
+        # the first document substitutes it once and then reuses it.
+        (2, 2, 7),
+        # Each document evicts the content which the next document needs.
+        (1, 6, 3),
+        # Contents larger than the cache are not kept.
+        (0, 9, 0),
+    ],
+)
+def test_included_content_is_cached(
+    *,
+    tmp_path: Path,
+    make_app: Callable[..., SphinxTestApp],
+    monkeypatch: pytest.MonkeyPatch,
+    cached_contents: int,
+    expected_misses: int,
+    expected_hits: int,
+) -> None:
+    """Included file content is substituted once and reused by later
+    documents with the same substitution table, while it is in the cache.
+    """
+    # The cache holds ``cached_contents`` of the substituted contents, which
+    # are at most this long.
+    monkeypatch.setattr(
+        target=sphinx_substitution_extensions,
+        name="_CONTENT_CACHE_MAX_CHARACTERS",
+        value=cached_contents * len(f"Included {tmp_path} for example."),
+    )
+    source_directory = tmp_path / "source"
+    source_directory.mkdir()
+    (source_directory / "conf.py").touch()
+    # The cache is shared by every build in a process, so the content is
+    # unique to this test.
+    (source_directory / "snippet.txt").write_text(
+        data=f"Literal {tmp_path} for |a|.",
+    )
+    (source_directory / "snippet.rst").write_text(
+        data=f"Included {tmp_path} for |a|.",
+    )
+    docnames = [f"document_{index}" for index in range(3)]
+    toctree_entries = "".join(f"   {docname}\n" for docname in docnames)
+    (source_directory / "index.rst").write_text(
+        data=f".. toctree::\n\n{toctree_entries}",
+    )
+    for docname in docnames:
+        (source_directory / f"{docname}.rst").write_text(
+            data=dedent(
+                text="""\
+                Title
+                =====
+
+                .. literalinclude:: snippet.txt
+                   :content-substitutions:
+
+                .. include:: snippet.rst
+                   :content-substitutions:
+                """,
+            ),
+        )
+
+    app = make_app(
+        srcdir=source_directory,
+        exception_on_warning=True,
+        confoverrides={
+            "extensions": ["sphinx_substitution_extensions"],
+            "rst_prolog": ".. |a| replace:: example\n",
+            "substitutions_instrumentation_enabled": True,
+        },
+    )
+    app.build()
+
+    assert app.statuscode == 0
+    statistics_path = Path(app.outdir) / "substitution-statistics.json"
+    total = json.loads(s=statistics_path.read_text())["total"]
+    assert total["content_cache_misses"] == expected_misses
+    assert total["content_cache_hits"] == expected_hits
+    for docname in docnames:
+        html = (app.outdir / f"{docname}.html").read_text()
+        assert "|a|" not in html
+        assert "for example." in html
+
+
+def test_hyperlink_target_cache_is_bounded(
+    *,
+    tmp_path: Path,
+    make_app: Callable[..., SphinxTestApp],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Substituted hyperlink targets are correct when the cache of
+    targets is smaller than the number of targets.
+    """
+    monkeypatch.setattr(
+        target=sphinx_substitution_extensions,
+        name="_HYPERLINK_TARGET_CACHE_SIZE",
+        value=1,
+    )
+    source_directory = tmp_path / "source"
+    source_directory.mkdir()
+    (source_directory / "conf.py").touch()
+    docnames = [f"document_{index}" for index in range(2)]
+    toctree_entries = "".join(f"   {docname}\n" for docname in docnames)
+    (source_directory / "index.rst").write_text(
+        data=f".. toctree::\n\n{toctree_entries}",
+    )
+    for docname in docnames:
+        (source_directory / f"{docname}.rst").write_text(
+            data=dedent(
+                text="""\
+                Title
+                =====
+
+                See `first`_ and `second`_.
+
+                .. _first: https://example.com/|a|
+                .. _second: https://example.com/|b|
+                """,
+            ),
+        )
+
+    app = make_app(
+        srcdir=source_directory,
+        exception_on_warning=True,
+        confoverrides={
+            "extensions": ["sphinx_substitution_extensions"],
+            "rst_prolog": dedent(
+                text="""\
+                .. |a| replace:: one
+                .. |b| replace:: two
+                """,
+            ),
+            "substitutions_hyperlink_targets_enabled": True,
+        },
+    )
+    app.build()
+
+    assert app.statuscode == 0
+    for docname in docnames:
+        html = (app.outdir / f"{docname}.html").read_text()
+        assert 'href="https://example.com/one"' in html
+        assert 'href="https://example.com/two"' in html
+
+
+@pytest.mark.parametrize(
+    argnames=("max_bytes", "expected_file_count"),
+    argvalues=[(100 * 1024 * 1024, 2), (0, 0)],
+)
+def test_disk_cache(
+    *,
+    tmp_path: Path,
+    make_app: Callable[..., SphinxTestApp],
+    monkeypatch: pytest.MonkeyPatch,
+    max_bytes: int,
+    expected_file_count: int,
+) -> None:
+    """With the on-disk cache enabled, substituted included content is
+    reused by later builds, and the cache is kept within its size limit.
+    """
+    # Keep nothing in memory, as if each build were in a new process.
+    monkeypatch.setattr(
+        target=sphinx_substitution_extensions,
+        name="_CONTENT_CACHE_MAX_CHARACTERS",
+        value=0,
+    )
+    source_directory = tmp_path / "source"
+    source_directory.mkdir()
+    (source_directory / "conf.py").touch()
+    (source_directory / "snippet.txt").write_text(data="Literal |a|.")
+    (source_directory / "snippet.rst").write_text(data="Included |a|.")
+    (source_directory / "index.rst").write_text(
+        data=dedent(
+            text="""\
+            .. literalinclude:: snippet.txt
+               :content-substitutions:
+
+            .. include:: snippet.rst
+               :content-substitutions:
+            """,
+        ),
+    )
+    confoverrides = {
+        "extensions": ["sphinx_substitution_extensions"],
+        "rst_prolog": ".. |a| replace:: example\n",
+        "substitutions_disk_cache_enabled": True,
+        "substitutions_disk_cache_max_bytes": max_bytes,
+        "substitutions_instrumentation_enabled": True,
+    }
+
+    disk_cache_statistics: list[tuple[int, int]] = []
+    for _ in range(2):
+        app = make_app(
+            srcdir=source_directory,
+            freshenv=True,
+            exception_on_warning=True,
+            confoverrides=confoverrides,
+        )
+        app.build()
+        assert app.statuscode == 0
+        html = (app.outdir / "index.html").read_text()
+        assert "|a|" not in html
+        assert "Included example." in html
+        statistics_path = Path(app.outdir) / "substitution-statistics.json"
+        total = json.loads(s=statistics_path.read_text())["total"]
+        disk_cache_statistics.append(
+            (total["disk_cache_hits"], total["disk_cache_misses"]),
+        )
+        cache_files = [
+            path
+            for path in (Path(app.doctreedir) / "substitution-cache").rglob(
+                pattern="*",
+            )
+            if path.is_file()
+        ]
+        assert len(cache_files) == expected_file_count
+        app.cleanup()
+
+    # The literal block's raw source and text are the same content, so the
+    # first build substitutes it once and then reads it from disk.
+    assert disk_cache_statistics == [
+        (1, 2),
+        (1 + expected_file_count, 2 - expected_file_count),
+    ]
+
+
+@pytest.mark.parametrize(
+    argnames=("min_bytes", "expected_streamed"),
+    argvalues=[(None, False), (0, True), (1024 * 1024, False)],
+)
+def test_streaming_literal_include(
+    *,
+    tmp_path: Path,
+    make_app: Callable[..., SphinxTestApp],
+    monkeypatch: pytest.MonkeyPatch,
+    min_bytes: int | None,
+    expected_streamed: bool,
+) -> None:
+    """Streamed included content is substituted as it is when it is not
+    streamed, including placeholders which straddle chunk boundaries.
+    Streamed content is not read whole by Sphinx first.
+    """
+    # Placeholders and multi-byte characters straddle three-byte chunks.
+    monkeypatch.setattr(
+        target=sphinx_substitution_extensions,
+        name="_STREAMING_CHUNK_SIZE",
+        value=3,
+    )
+    read_filenames: list[str] = []
+    read_file = LiteralIncludeReader.read_file
+
+    def record_read_file(
+        self: LiteralIncludeReader,
+        filename: str,
+        location: tuple[str, int] | None,
+    ) -> list[str]:
+        """Record the files which Sphinx reads whole."""
+        read_filenames.append(Path(filename).name)
+        return read_file(self=self, filename=filename, location=location)
+
+    monkeypatch.setattr(
+        target=LiteralIncludeReader,
+        name="read_file",
+        value=record_read_file,
+    )
+    source_directory = tmp_path / "source"
+    source_directory.mkdir()
+    (source_directory / "conf.py").touch()
+    (source_directory / "snippet.txt").write_bytes(
+        data="Caf\u00e9 |a|\r\n|a| and |a|\r|a|".encode(),
+    )
+    (source_directory / "index.rst").write_text(
+        data=dedent(
+            text="""\
+            .. literalinclude:: snippet.txt
+               :content-substitutions:
+               :caption: Caption |a|
+            """,
+        ),
+    )
+
+    app = make_app(
+        srcdir=source_directory,
+        exception_on_warning=True,
+        confoverrides={
+            "extensions": ["sphinx_substitution_extensions"],
+            "rst_prolog": ".. |a| replace:: example\n",
+            "substitutions_streaming_min_bytes": min_bytes,
+        },
+    )
+    app.build()
+
+    assert app.statuscode == 0
+    doctree = app.env.get_doctree(docname="index")
+    (block,) = doctree.findall(condition=nodes.literal_block)
+    expected = "Caf\u00e9 example\nexample and example\nexample"
+    assert block.astext() == expected
+    assert block.rawsource == expected
+    (caption,) = doctree.findall(condition=nodes.caption)
+    assert caption.astext() == "Caption example"
+    assert read_filenames == ([] if expected_streamed else ["snippet.txt"])
+
+
+def test_streaming_literal_include_warnings(
+    *,
+    tmp_path: Path,
+    make_app: Callable[..., SphinxTestApp],
+) -> None:
+    """Files which cannot be streamed give the warnings which they give
+    when they are not streamed.
+    """
+    source_directory = tmp_path / "source"
+    source_directory.mkdir()
+    (source_directory / "conf.py").touch()
+    (source_directory / "latin1.txt").write_bytes(data=b"Caf\xe9 |a|\n")
+    (source_directory / "index.rst").write_text(
+        data=dedent(
+            text="""\
+            .. literalinclude:: missing.txt
+               :content-substitutions:
+
+            .. literalinclude:: latin1.txt
+               :content-substitutions:
+            """,
+        ),
+    )
+
+    warnings: dict[int | None, str] = {}
+    for min_bytes in (None, 0):
+        app = make_app(
+            srcdir=source_directory,
+            freshenv=True,
+            confoverrides={
+                "extensions": ["sphinx_substitution_extensions"],
+                "rst_prolog": ".. |a| replace:: example\n",
+                "substitutions_streaming_min_bytes": min_bytes,
+            },
+        )
+        app.build()
+        warnings[min_bytes] = app.warning.getvalue()
+        app.cleanup()
+
+    assert "missing.txt' not found" in warnings[None]
+    assert "seems to be wrong" in warnings[None]
+    assert warnings[0] == warnings[None]
+
+
+def test_substitutions_before_filters_diff(
+    *,
+    tmp_path: Path,
+    make_app: Callable[..., SphinxTestApp],
+) -> None:
+    """With ``:substitutions-before-filters:``, both files given to
+    ``literalinclude`` with ``:diff:`` are substituted before they are
+    compared.
+    """
+    source_directory = tmp_path / "source"
+    source_directory.mkdir()
+    (source_directory / "conf.py").touch()
+    (source_directory / "old.txt").write_text(data="Same\nOld |a|\n")
+    (source_directory / "new.txt").write_text(data="Same\nNew |a|\n")
+    (source_directory / "index.rst").write_text(
+        data=dedent(
+            text="""\
+            .. |a| replace:: example
+
+            .. literalinclude:: new.txt
+               :content-substitutions:
+               :substitutions-before-filters:
+               :diff: old.txt
+            """,
+        ),
+    )
+
+    app = make_app(
+        srcdir=source_directory,
+        exception_on_warning=True,
+        confoverrides={"extensions": ["sphinx_substitution_extensions"]},
+    )
+    app.build()
+
+    assert app.statuscode == 0
+    doctree = app.env.get_doctree(docname="index")
+    (block,) = doctree.findall(condition=nodes.literal_block)
+    assert block["language"] == "udiff"
+    assert "-Old example\n+New example\n" in block.astext()
+
+
+@pytest.mark.parametrize(
+    argnames=("options", "file_insertion_enabled", "expected_warning"),
+    argvalues=[
+        ("", False, "File insertion disabled"),
+        (":emphasize-lines: 5\n", True, "out of range(1-1): '5'"),
+        (":lines: 5\n", True, "Line spec '5': no lines pulled"),
+    ],
+)
+def test_substitutions_before_filters_warnings(
+    *,
+    tmp_path: Path,
+    make_app: Callable[..., SphinxTestApp],
+    options: str,
+    file_insertion_enabled: bool,
+    expected_warning: str,
+) -> None:
+    """With ``:substitutions-before-filters:``, ``literalinclude`` warns
+    as it does without the option.
+    """
+    source_directory = tmp_path / "source"
+    source_directory.mkdir()
+    (source_directory / "conf.py").touch()
+    (source_directory / "example.txt").write_text(data="Content |a|\n")
+    (source_directory / "index.rst").write_text(
+        data=(
+            ".. literalinclude:: example.txt\n"
+            "   :content-substitutions:\n"
+            "   :substitutions-before-filters:\n"
+            + "".join(f"   {line}\n" for line in options.splitlines())
+        ),
+    )
+
+    app = make_app(
+        srcdir=source_directory,
+        confoverrides={
+            "extensions": ["sphinx_substitution_extensions"],
+            "rst_prolog": ".. |a| replace:: example\n",
+        },
+    )
+    app.env.settings["file_insertion_enabled"] = file_insertion_enabled
+    app.build()
+
+    assert app.statuscode == 0
+    assert expected_warning in app.warning.getvalue()
+
+
+@pytest.mark.parametrize(
+    argnames="options",
+    argvalues=[
+        (
+            ":caption: Example\n:name: example\n:lineno-match:\n"
+            ":lines: 2-3\n:emphasize-lines: 1\n:class: custom\n"
+            ":language: shell\n"
+        ),
+        (
+            ":caption:\n:linenos:\n:lineno-start: 10\n:start-after: first\n"
+            ":end-before: last\n:dedent: 2\n:force:\n"
+        ),
+        ":diff: other.txt\n",
+    ],
+)
+def test_substitutions_before_filters_matches_literalinclude(
+    *,
+    tmp_path: Path,
+    make_app: Callable[..., SphinxTestApp],
+    options: str,
+) -> None:
+    """With ``:substitutions-before-filters:``, ``literalinclude`` makes the
+    same nodes as Sphinx's ``literalinclude`` for content without
+    placeholders.
+    """
+    option_lines = "".join(f"   {line}\n" for line in options.splitlines())
+    directive_options = {
+        "upstream": "",
+        "substituted": (
+            "   :content-substitutions:\n   :substitutions-before-filters:\n"
+        ),
+    }
+    doctrees: dict[str, list[str]] = {}
+    for name, substitution_options in directive_options.items():
+        source_directory = tmp_path / name
+        source_directory.mkdir()
+        (source_directory / "conf.py").touch()
+        (source_directory / "example.txt").write_text(
+            data="first\n  second\n  third\nlast\n",
+        )
+        (source_directory / "other.txt").write_text(
+            data="first\n  second\nlast\n",
+        )
+        (source_directory / "index.rst").write_text(
+            data=(
+                ".. literalinclude:: example.txt\n"
+                + substitution_options
+                + option_lines
+            ),
+        )
+        app = make_app(
+            srcdir=source_directory,
+            exception_on_warning=True,
+            confoverrides={"extensions": ["sphinx_substitution_extensions"]},
+        )
+        app.build()
+        assert app.statuscode == 0
+        doctrees[name] = [
+            child.pformat().replace(str(object=source_directory), "")
+            for child in app.env.get_doctree(docname="index").children
+        ]
+        app.cleanup()
+
+    assert doctrees["substituted"] == doctrees["upstream"]
+
+
+# A document with the extension's directives and roles, both where they can
+# be substituted in the source and where they are left to be substituted when
+# the document is parsed.
+_SOURCE_READ_DOCUMENT = """\
+Title :substitution-code:`|a|`
+==============================
+
+Run :substitution-code:`echo |a|` in a paragraph.
+
+Run :substitution-code:`|a|` with ``other`` inline markup.
+
+| Run :substitution-code:`|a|` in a line block.
+
+>>> :substitution-code:`|a|`
+
+.. code-block:: shell
+   :substitutions:
+   :caption: Caption |a|
+
+   echo |a|
+
+.. code-block:: shell
+   :substitutions:
+
+   echo |a|
+   \techo |a|
+
+.. code-block:: shell
+   :substitutions:
+   :caption: Caption |a|
+      continued
+
+   echo |a|
+
+.. code-block:: shell
+   :nosubstitutions:
+
+   echo |a|
+
+.. code-block:: shell
+
+   echo |a|
+
+.. note::
+   :class: custom
+
+   Run :substitution-code:`|a|` in a note.
+
+   .. code-block:: shell
+      :substitutions:
+
+      echo |a|
+
+.. A comment with :substitution-code:`|a|`.
+
+Indented literal block::
+
+   Run :substitution-code:`|a|` in a literal block.
+
+Quoted literal block::
+
+> Run :substitution-code:`|a|` in a literal block.
+
+=====  ============================
+Row    Text
+=====  ============================
+One    :substitution-code:`|a|`
+
+Two    :substitution-code:`|a|`
+=====  ============================
+
+.. image:: |author|_diagram.png
+   :path-substitutions:
+
+.. literalinclude:: |author|.txt
+   :path-substitutions:
+
+.. include:: |author|.txt
+   :path-substitutions:
+   :literal:
+
+Run :substitution-code:`|a|` after an include.
+"""
+
+
+@pytest.mark.parametrize(
+    argnames=("rst_prolog", "document_prefix", "expected_substituted"),
+    argvalues=[
+        (
+            "\n.. |a| replace:: example\n.. |author| replace:: Eleanor\n",
+            "",
+            True,
+        ),
+        (
+            ".. |a| replace:: **example**\n.. |author| replace:: Eleanor\n",
+            "",
+            False,
+        ),
+        (
+            ".. |a| replace:: example\n.. |author| replace:: Eleanor\n",
+            ".. |b| replace:: local\n\n",
+            False,
+        ),
+    ],
+)
+def test_source_read_substitutions(
+    *,
+    tmp_path: Path,
+    make_app: Callable[..., SphinxTestApp],
+    rst_prolog: str,
+    document_prefix: str,
+    expected_substituted: bool,
+) -> None:
+    """With ``substitutions_source_read_enabled``, substitutions are applied
+    to reST source before it is parsed, and the output is the same as
+    without the setting.
+    """
+    sample_source_directory = (
+        Path(__file__).parent.parent / "sample" / "source"
+    )
+    outputs: dict[bool, dict[Path, bytes]] = {}
+    read_sources: dict[str, str] = {}
+    for enabled in (False, True):
+        source_directory = tmp_path / f"source-{enabled}"
+        source_directory.mkdir()
+        (source_directory / "conf.py").touch()
+        for filename in ("Eleanor.txt", "Eleanor_diagram.png"):
+            shutil.copy2(
+                src=sample_source_directory / filename,
+                dst=source_directory / filename,
+            )
+        (source_directory / "index.rst").write_text(
+            data=document_prefix
+            + _SOURCE_READ_DOCUMENT
+            + "\n.. toctree::\n\n   other\n   markdown_document\n",
+        )
+        (source_directory / "other.rst").write_text(
+            data="Other\n=====\n\nRun :substitution-code:`|a|`.\n",
+        )
+        (source_directory / "markdown_document.md").write_text(
+            data="# Title\n\nRun {substitution-code}`|a|`.\n",
+        )
+
+        app = make_app(
+            srcdir=source_directory,
+            exception_on_warning=True,
+            confoverrides={
+                "extensions": [
+                    "myst_parser",
+                    "sphinx_substitution_extensions",
+                ],
+                "rst_prolog": rst_prolog,
+                "substitutions_source_read_enabled": enabled,
+            },
+        )
+
+        def record_source(
+            _app: Sphinx,
+            docname: str,
+            source: list[str],
+        ) -> None:
+            """Record the source of each document after substitution."""
+            read_sources[docname] = source[0]
+
+        app.connect(event="source-read", callback=record_source, priority=900)
+        if not enabled:
+            assert not is_role_registered(name="substituted-code")
+        outputs[enabled] = _build_and_read_output(app=app, pattern="*.html")
+
+    assert outputs[True] == outputs[False]
+    assert read_sources["markdown_document"] == (
+        "# Title\n\nRun {substitution-code}`|a|`.\n"
+    )
+    index_source = read_sources["index"]
+    if not expected_substituted:
+        assert ":substituted-code:" not in index_source
+        return
+
+    substituted_roles = [
+        "Run :substituted-code:`echo example` in a paragraph.",
+        "Run :substituted-code:`example` in a note.",
+    ]
+    for role in substituted_roles:
+        assert role in index_source
+    assert index_source.count(":substituted-code:") == len(substituted_roles)
+    substituted_code_blocks = [
+        "   :nosubstitutions:\n   :caption: Caption |a|\n\n   echo example\n",
+        "      :nosubstitutions:\n\n      echo example\n",
+    ]
+    for code_block in substituted_code_blocks:
+        assert code_block in index_source
+    assert index_source.count(" echo example\n") == len(
+        substituted_code_blocks,
+    )
+    for directive in ("image", "literalinclude", "include"):
+        assert f".. {directive}:: Eleanor" in index_source
+    assert index_source.count(":nopath-substitutions:") == len(
+        ("image", "literalinclude", "include"),
+    )
+    assert "Run :substitution-code:`|a|` after an include." in index_source
+    assert "Run :substituted-code:`example`." in read_sources["other"]
+
+
+def test_source_read_enabled_rereads_documents(
+    *,
+    tmp_path: Path,
+    make_app: Callable[..., SphinxTestApp],
+) -> None:
+    """Changing ``substitutions_source_read_enabled`` reads the reST
+    documents which use the prolog substitutions again.
+    """
+    source_directory = tmp_path / "source"
+    source_directory.mkdir()
+    (source_directory / "conf.py").touch()
+    (source_directory / "index.rst").write_text(
+        data=dedent(
+            text="""\
+            Index
+            =====
+
+            Run :substitution-code:`|a|`.
+
+            .. toctree::
+
+               local
+               markdown_document
+            """,
+        ),
+    )
+    (source_directory / "local.rst").write_text(
+        data=".. |b| replace:: local\n\nLocal\n=====\n",
+    )
+    (source_directory / "markdown_document.md").write_text(
+        data="# Title\n\nRun {substitution-code}`|a|`.\n",
+    )
+    confoverrides = {
+        "extensions": ["myst_parser", "sphinx_substitution_extensions"],
+        "rst_prolog": ".. |a| replace:: example\n",
+    }
+
+    read_docnames: list[str] = []
+
+    def on_env_before_read_docs(
+        _app: Sphinx,
+        _env: object,
+        docnames: list[str],
+    ) -> None:
+        """Record the documents which will be read."""
+        read_docnames.extend(docnames)
+
+    all_read_docnames: list[list[str]] = []
+    for enabled in (False, True, True, False):
+        app = make_app(
+            srcdir=source_directory,
+            exception_on_warning=True,
+            confoverrides={
+                **confoverrides,
+                "substitutions_source_read_enabled": enabled,
+            },
+        )
+        app.connect(
+            event="env-before-read-docs",
+            callback=on_env_before_read_docs,
+        )
+        app.build()
+        assert app.statuscode == 0
+        assert "example" in (app.outdir / "index.html").read_text()
+        app.cleanup()
+        all_read_docnames.append(sorted(read_docnames))
+        read_docnames.clear()
+
+    assert all_read_docnames == [
+        ["index", "local", "markdown_document"],
+        ["index"],
+        [],
+        ["index"],
+    ]
+
+
+@pytest.mark.parametrize(
+    argnames=("environment_value", "expected_error"),
+    argvalues=[
+        ("", "BeartypeCallHintParamViolation"),
+        ("1", "AttributeError"),
+    ],
+)
+def test_skip_type_checks_environment_variable(
+    *,
+    environment_value: str,
+    expected_error: str,
+) -> None:
+    """Runtime type checks are skipped when the environment variable is
+    set before the extension is imported.
+    """
+    code = dedent(
+        text="""\
+        from sphinx_substitution_extensions import setup
+
+        setup(app=None)
+        """,
+    )
+    result = subprocess.run(  # noqa: S603
+        args=[sys.executable, "-c", code],
+        env={
+            **os.environ,
+            SKIP_TYPE_CHECKS_ENVIRONMENT_VARIABLE: environment_value,
+        },
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+
+    assert result.returncode != 0
+    assert expected_error in result.stderr
+
+
+def test_import_does_not_import_myst_parser() -> None:
+    """Importing the extension does not import MyST's parser, which is slow
+    to import and is not needed by projects which only use reST.
+    """
+    code = dedent(
+        text="""\
+        import sys
+
+        import sphinx_substitution_extensions
+
+        sys.stdout.write(repr(sorted(sys.modules)))
+        """,
+    )
+    result = subprocess.run(  # noqa: S603
+        args=[sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert "'myst_parser.mocking'" not in result.stdout
+    assert "'myst_parser.mdit_to_docutils.base'" not in result.stdout
+
+
+def test_rst_build_does_not_import_myst_parser(
+    *,
+    tmp_path: Path,
+    make_app: Callable[..., SphinxTestApp],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Substitutions work in a project which only uses reST without
+    importing MyST's parser.
+    """
+    monkeypatch.delitem(
+        dic=sys.modules,
+        name="myst_parser.mocking",
+        raising=False,
+    )
+    source_directory = tmp_path / "source"
+    source_directory.mkdir()
+    (source_directory / "conf.py").touch()
+    (source_directory / "index.rst").write_text(
+        data=dedent(
+            text="""\
+            .. |a| replace:: example
+
+            .. code-block:: shell
+               :substitutions:
+
+               $ echo |a|
+
+            Run :substitution-code:`echo |a|`.
+            """,
+        ),
+    )
+
+    app = make_app(
+        srcdir=source_directory,
+        exception_on_warning=True,
+        confoverrides={"extensions": ["sphinx_substitution_extensions"]},
+    )
+    app.build()
+
+    assert app.statuscode == 0
+    content_html = (app.outdir / "index.html").read_text()
+    assert "|a|" not in content_html
+    assert "example" in content_html
+    assert "myst_parser.mocking" not in sys.modules
+
+
+def test_substitution_engine_from_definitions() -> None:
+    """An engine built from definitions applies them to texts and trees."""
+    engine = (
+        sphinx_substitution_extensions.SubstitutionEngine.from_definitions(
+            substitution_defs={"a": "example", "b": "other"},
+            delimiter_pairs={("|", "|"), ("{{", "}}")},
+        )
+    )
+
+    assert engine.apply(text="|a| and {{b}}") == "example and other"
+    assert engine.apply_many(texts=iter(["|a|", "plain", "{{a}} |c|"])) == [
+        "example",
+        "plain",
+        "example |c|",
+    ]
+
+    tree = nodes.paragraph(
+        "Text |a|",
+        "",
+        nodes.Text(data="Text |a|"),
+        nodes.literal("", "", nodes.Text(data="{{b}}")),
+    )
+    engine.apply_tree(node=tree)
+    assert tree.rawsource == "Text example"
+    assert tree.astext() == "Text exampleother"
+
+
+def test_substitution_engine_from_document(
+    *,
+    tmp_path: Path,
+    make_app: Callable[..., SphinxTestApp],
+) -> None:
+    """An engine built from a document being read applies the
+    substitutions which the directives in the document use, without
+    counting its texts in the document's statistics.
+    """
+    source_directory = tmp_path / "source"
+    source_directory.mkdir()
+    (source_directory / "conf.py").touch()
+    (source_directory / "index.rst").write_text(
+        data=".. |b| replace:: local\n\nText.\n",
+    )
+
+    app = make_app(
+        srcdir=source_directory,
+        exception_on_warning=True,
+        confoverrides={
+            "extensions": ["sphinx_substitution_extensions"],
+            "rst_prolog": ".. |a| replace:: example\n",
+            "substitutions_instrumentation_enabled": True,
+        },
+    )
+    substituted_texts: list[str] = []
+
+    def substitute_texts(_app: Sphinx, doctree: nodes.document) -> None:
+        """Substitute texts with an engine for the document."""
+        engine = (
+            sphinx_substitution_extensions.SubstitutionEngine.from_document(
+                env=app.env,
+                doctree=doctree,
+            )
+        )
+        substituted_texts.extend(
+            engine.apply_many(texts=["Version |a|", "By |b|", "Not |c|"]),
+        )
+
+    app.connect(event="doctree-read", callback=substitute_texts)
+    app.build()
+
+    assert app.statuscode == 0
+    assert substituted_texts == ["Version example", "By local", "Not |c|"]
+    statistics_path = Path(app.outdir) / "substitution-statistics.json"
+    statistics = json.loads(s=statistics_path.read_text())
+    assert statistics["total"]["texts"] == 0
+    assert statistics["total"]["placeholders"] == 0
+
+
+def test_substitution_engine_from_lazy_document(
+    *,
+    tmp_path: Path,
+    make_app: Callable[..., SphinxTestApp],
+) -> None:
+    """An engine built from a Markdown document with lazy resolution
+    resolves nested placeholders without counting its texts in the
+    document's statistics.
+    """
+    source_directory = tmp_path / "source"
+    source_directory.mkdir()
+    (source_directory / "conf.py").touch()
+    (source_directory / "index.md").write_text(data="Text.\n")
+
+    app = make_app(
+        srcdir=source_directory,
+        exception_on_warning=True,
+        confoverrides={
+            "extensions": ["myst_parser", "sphinx_substitution_extensions"],
+            "myst_enable_extensions": ["substitution"],
+            "myst_substitutions": {"release": {"version": "1.0"}},
+            "substitutions_instrumentation_enabled": True,
+            "substitutions_lazy_resolution_enabled": True,
+        },
+    )
+    substituted_texts: list[str] = []
+
+    def substitute_texts(_app: Sphinx, doctree: nodes.document) -> None:
+        """Substitute texts with an engine for the document."""
+        engine = (
+            sphinx_substitution_extensions.SubstitutionEngine.from_document(
+                env=app.env,
+                doctree=doctree,
+            )
+        )
+        substituted_texts.extend(
+            engine.apply_many(texts=["Version |release.version|", "|a|"]),
+        )
+
+    app.connect(event="doctree-read", callback=substitute_texts)
+    app.build()
+
+    assert app.statuscode == 0
+    assert substituted_texts == ["Version 1.0", "|a|"]
+    statistics_path = Path(app.outdir) / "substitution-statistics.json"
+    statistics = json.loads(s=statistics_path.read_text())
+    assert statistics["total"]["texts"] == 0
+
+
+def test_substitution_engine_from_document_after_read(
+    *,
+    tmp_path: Path,
+    make_app: Callable[..., SphinxTestApp],
+) -> None:
+    """An engine cannot be built from a document after it is read."""
+    source_directory = tmp_path / "source"
+    source_directory.mkdir()
+    (source_directory / "conf.py").touch()
+    (source_directory / "index.rst").write_text(data="Text.\n")
+
+    app = make_app(
+        srcdir=source_directory,
+        exception_on_warning=True,
+        confoverrides={"extensions": ["sphinx_substitution_extensions"]},
+    )
+    errors: list[SphinxError] = []
+
+    def create_engine(
+        _app: Sphinx,
+        doctree: nodes.document,
+        _docname: str,
+    ) -> None:
+        """Try to create an engine for a resolved document."""
+        try:
+            sphinx_substitution_extensions.SubstitutionEngine.from_document(
+                env=app.env,
+                doctree=doctree,
+            )
+        except SphinxError as exc:
+            errors.append(exc)
+
+    app.connect(event="doctree-resolved", callback=create_engine)
+    app.build()
+
+    assert app.statuscode == 0
+    expected_message = (
+        "A SubstitutionEngine can only be created from a document while "
+        "the document is read, such as in a doctree-read handler. Use "
+        "SubstitutionEngine.from_definitions at other times."
+    )
+    assert [str(object=error) for error in errors] == [expected_message]